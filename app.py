@@ -1,21 +1,39 @@
 import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output, State
+from dash import dcc, html, Patch
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import pandas as pd
+import numpy as np
 import json
 import geopandas as gpd
 from dash_extensions import EventListener
 import plotly.express as px
 import plotly.graph_objects as go
 import copy
+import logging
+import os
+import threading
+from flask import request
 from shapely.geometry import shape
+from background_jobs import create_background_manager, worker_slot
+from figure_cache import create_cache, cached_figure, data_version
+from memory_footprint import log_memory_report
+from metrics import init_metrics
+from static_responses import init_static_responses
+from vector_tiles import Tileset, init_vector_tiles, tile_url
+from warmup import Warmup, init_readiness
+from boundaries import data_path
+from rsqa_cube import CUBE_DIR, CUBE_TABLES
+
+logger = logging.getLogger(__name__)
 
 # Import your visualization modules
 from page1.visu_a import load_page1_data, create_page1_figures
 from page2.visu_a import load_page2_data, create_page2_figures
-from page3.visu_a import load_page3_data, create_page3_figures, carte_espaces_verts
+from page3.visu_a import (load_page3_data, create_page3_figures, carte_espaces_verts,
+                          park_tile_layers, territory_geojson, tile_map_layers, PARKS_TILESET)
 from page4.visu_a import load_page4_data, create_page4_figures
-from page5.visu_a import load_page5_data, create_page5_figures, add_bars
+from page5.visu_a import (load_page5_data, create_page5_figures, create_rsqa_map,
+                          QUALITY_CATEGORIES, QUALITY_COLORS)
 
 # Initialize the Dash app
 app = dash.Dash(
@@ -23,23 +41,92 @@ app = dash.Dash(
     meta_tags=[
         {"name": "viewport", "content": "width=device-width, initial-scale=1.0"}
     ],
+    # Callbacks lourds (cartes) exécutés hors du thread de requête
+    background_callback_manager=create_background_manager(),
 )
 app.title = "Montréal en Visualisations"
 server = app.server  # For deployment platforms
+cache = create_cache(server)  # Figures partagées entre les workers
+callback_metrics = init_metrics(server)  # Latence et taille des réponses par callback, sur /metrics
+# Layout et cartes des sections sérialisés une seule fois (PRESERIALIZED_RESPONSES=0 pour désactiver)
+PRESERIALIZED_RESPONSES = os.environ.get("PRESERIALIZED_RESPONSES", "1") != "0"
+static_responses = init_static_responses(app) if PRESERIALIZED_RESPONSES else None
+
+# Registre des sections : données et figures sont chargées au premier accès
+# puis mémorisées, pour que la page s'affiche sans attendre la section la plus lente
+SECTIONS = {
+    1: (load_page1_data, create_page1_figures),
+    2: (load_page2_data, create_page2_figures),
+    3: (load_page3_data, create_page3_figures),
+    4: (load_page4_data, create_page4_figures),
+    5: (load_page5_data, create_page5_figures),
+}
+# Fichiers dont sont tirées les figures mises en cache d'une section : leur
+# version, relevée au chargement, fait partie des clés du cache des figures
+SECTION_SOURCES = {
+    3: ["espace_vert.geojson", "montreal.json"],
+    # Cube RSQA : complété par append_export, sa réécriture change la version
+    5: [os.path.join(CUBE_DIR, f"{name}.parquet") for name in CUBE_TABLES]
+       + ["liste-des-stations-rsqa.csv", "updated_montreal.json"],
+}
+_loaded_sections = {}
+_section_locks = {number: threading.Lock() for number in SECTIONS}
+
+def get_section(number):
+    """Return the data and figures of a section, loading them on first access"""
+    section = _loaded_sections.get(number)
+    if section is None:
+        with _section_locks[number]:
+            section = _loaded_sections.get(number)
+            if section is None:
+                load_data, create_figures = SECTIONS[number]
+                sources = [data_path(name) for name in SECTION_SOURCES.get(number, [])]
+                version = data_version(sources)
+                data = load_data()
+                # Fichiers réécrits pendant le chargement (cube reconstruit ou complété) :
+                # version propre à ce chargement, qui ne relit aucune entrée antérieure
+                loaded_version = data_version(sources)
+                if loaded_version != version:
+                    version = f"{version}{loaded_version}"
+                section = {'data': data, 'figures': create_figures(data), 'version': version}
+                _loaded_sections[number] = section
+    return section
+
+# Tuiles vectorielles des parcs et arrondissements (page 3), sous le préfixe des routes Dash
+tilesets = init_vector_tiles(app, {
+    PARKS_TILESET: Tileset(
+        PARKS_TILESET,
+        lambda: park_tile_layers(get_section(3)['data']),
+        [data_path("espace_vert.geojson"), data_path("montreal.json")]
+    ),
+})
+
+def with_tile_layers(figure):
+    """
+    Copie (dict) d'une carte des parcs avec les couches de tuiles de ce serveur.
+    Les URL (préfixe de l'application, version des sources) sont relatives à
+    l'hôte : le navigateur les rend absolues (with_tile_urls).
+    """
+    if hasattr(figure, "to_plotly_json"):
+        figure = figure.to_plotly_json()
+    layout = dict(figure["layout"])
+    layout["mapbox"] = {**layout.get("mapbox", {}), "layers": tile_map_layers(tile_url(app, tilesets[PARKS_TILESET]))}
+    return {**figure, "layout": layout}
+
+def placeholder_figure():
+    """Empty figure displayed while a section is loading"""
+    fig = go.Figure()
+    fig.update_layout(
+        xaxis={"visible": False},
+        yaxis={"visible": False},
+        annotations=[{"text": "Chargement…", "showarrow": False, "font": {"size": 16}}],
+        margin=dict(l=0, r=0, t=0, b=0),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)"
+    )
+    return fig
 
-# Load data for all pages
-data1 = load_page1_data()
-data2 = load_page2_data()
-data3 = load_page3_data()
-data4 = load_page4_data()
-data5 = load_page5_data()
-
-# Create figures
-figures1 = create_page1_figures(data1)
-figures2 = create_page2_figures(data2)
-figures3 = create_page3_figures(data3)
-figures4 = create_page4_figures(data4)
-figures5 = create_page5_figures(data5)
+PLACEHOLDER_FIGURE = placeholder_figure()
 
 
 POLLUTANT_FULL_NAMES = {
@@ -53,6 +140,50 @@ POLLUTANT_FULL_NAMES = {
     "PM": "Particules fines",
     "SO2": "Dioxyde de soufre"
 }
+
+def lazy_section(number, children):
+    """
+    Section dont les cartes sont chargées lorsqu'elle approche de la zone
+    visible : observe_sections (assets/clientside.js) passe alors le
+    dcc.Store section{number}-visible à True.
+    """
+    store = f"section{number}-visible"
+    return html.Section(children + [dcc.Store(id=store)], className="section",
+                        **{"data-visible-store": store})
+
+def time_series_figure():
+    """
+    Courbe IQA journalière sans données : sa mise en forme est envoyée une fois
+    avec le layout, chaque clic n'en remplace que les tableaux (update_time_series)
+    """
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=[],
+        y=[],
+        mode="lines",
+        line=dict(color="black", width=2),
+        customdata=[],
+        hovertemplate="<b>%{x|%Y-%m-%d}</b><br><span style='background-color:%{customdata[1]}; padding:5px;'>%{customdata[0]} : %{y} indice atteint pour polluant %{customdata[2]}</span><extra></extra>",
+        hoverlabel=dict(
+            bgcolor=[],
+            font_size=12,
+            font_color="white" 
+        ),
+    ))
+    fig.update_layout(
+        xaxis=dict(
+            showticklabels=True,
+            tickmode="auto",
+            tickformat="%b",
+            showgrid=True,
+            dtick="M1"
+        )
+    )
+    return fig
+
+TIME_SERIES_FIGURE = time_series_figure()
+EMPTY_SERIES = {"x": [], "y": [], "customdata": [], "colors": []}
+
 initial_ts = go.Figure()
 initial_ts.update_layout(
     title="Cliquez sur une station…",
@@ -79,37 +210,39 @@ app.layout = html.Div([
     ], className="nav-bar"),
 
     # Section 1: Page 1 visualization
-    html.Section([
+    lazy_section(1, [
         html.H2("Mon quartier est-il vert ?", id="section1"),
         html.Div([
             html.Div([
                 html.H3("Avantages des surfaces végétales en milieux urbains"),
-                html.Div("Cliquez sur un quartier pour voir les détails.", id="info_veg"),
-                dcc.Graph(id="pie_chart", figure=figures1["pie"]),
+                dcc.Markdown("Cliquez sur un quartier pour voir les détails.", id="info_veg", dangerously_allow_html=True),
+                dcc.Store(id="veg-stats"),
+                dcc.Graph(id="pie_chart", figure=PLACEHOLDER_FIGURE),
             ], className="viz-column"),
             html.Div([
                 html.H3("Proportion de surface végétale par arrondissement"),
-                dcc.Graph(id="map_section1", figure=figures1["map"])
+                dcc.Graph(id="map_section1", figure=PLACEHOLDER_FIGURE)
             ], className="viz-column-wide")
         ], className="viz-row")
-    ], className="section"),
+    ]),
 
     # Section 2: Page 2 visualization
-    html.Section([
+    lazy_section(2, [
         html.H2("Arbres urbains", id="section2"),
         html.Div([
             html.Div([
-                dcc.Graph(id="quartiers_map", figure=figures2["map"]),
+                dcc.Graph(id="quartiers_map", figure=PLACEHOLDER_FIGURE),
             ], className="viz-column-wide"),
             html.Div([
                 html.H3("Avantages des arbres en milieux Urbains"),
-                html.Div("Cliquez sur un quartier pour voir les détails.", id="info"),
+                dcc.Markdown("Cliquez sur un quartier pour voir les détails.", id="info", dangerously_allow_html=True),
+                dcc.Store(id="arbres-stats"),
             ], className="viz-column")
         ], className="viz-row")
-    ], className="section"),
+    ]),
 
     # Section 3: Page 3 visualization
-    html.Section([
+    lazy_section(3, [
         html.H2("Parcs de mon quartier", id="section3"),
         html.Div([
             html.Div([
@@ -117,7 +250,7 @@ app.layout = html.Div([
                 html.Div('', id='parcs_info', style={"width": "100%", "height": "170px", "overflow": "auto", "marginBottom": "5px"}),
                 html.Div(style={"width": "100%", "flex": "1", "minHeight": "350px"}, 
                          children=[
-                             dcc.Graph(id="parcs_arrondissement_map", figure=figures3["territoires_map"], 
+                             dcc.Graph(id="parcs_arrondissement_map", figure=PLACEHOLDER_FIGURE, 
                                       style={"height": "100%"}),
                          ])
             ], className="viz-column", style={"height": "100%", "display": "flex", "flexDirection": "column"}),
@@ -126,10 +259,12 @@ app.layout = html.Div([
                     id="hover-info",
                     style={"textAlign": "center", "marginBottom": "5px", "height": "auto"},
                 ),
+                html.Div("", id="parcs-progress", className="map-progress", style={"display": "none"}),
+                dcc.Store(id="parcs-map-figure"),
                 html.Div(style={"flex": "1", "width": "100%", "position": "relative"},
                     children=[
                         EventListener(
-                            dcc.Graph(id="espace_verts_map", figure=figures3["espace_verts_map"],
+                            dcc.Graph(id="espace_verts_map", figure=PLACEHOLDER_FIGURE,
                                     style={"height": "100%", "width": "100%", "position": "absolute"}),
                             events=[{"event": "plotly_hover", "props": ["points[0].location"]}],
                         ),
@@ -137,10 +272,10 @@ app.layout = html.Div([
                 )
             ], className="viz-column-wide", style={"height": "100%", "display": "flex", "flexDirection": "column"})
         ], className="viz-row")
-    ], className="section"),
+    ]),
 
     # Section 4: Page 4 visualization
-    html.Section([
+    lazy_section(4, [
         html.H2("Jardins communautaires", id="section4"),
         html.Div([
             html.Div([
@@ -149,14 +284,13 @@ app.layout = html.Div([
             ], className="viz-column"),
             html.Div([
                 html.H3("Parcelles de jardins communautaires de montréal"),
-                dcc.Graph(id="jardins_map", figure=figures4["map"], config={'scrollZoom': False, 'displayModeBar': False, 'editable': False}),
+                dcc.Graph(id="jardins_map", figure=PLACEHOLDER_FIGURE, config={'scrollZoom': False, 'displayModeBar': False, 'editable': False}),
             ], className="viz-column-wide")
         ], className="viz-row")
-    ], className="section"),
+    ]),
 
     # Section 5: Page 5 visualization
-    html.Section([
-        html.Div(id='hidden-div-for-initializing-bars', style={'display': 'none'}),
+    lazy_section(5, [
         html.H2("Réseaux de surveillance de la qualité de l'air (RSQA)", id="section5"),
         html.Div([
             html.Div(
@@ -175,19 +309,22 @@ app.layout = html.Div([
                     html.Div(
                             style={"width": "100%", "height": "400px", "overflow": "hidden"},  # Adjust height & prevent overlap
                             children=[
-                                dcc.Graph(id="time_series", figure=None, config={'displayModeBar': False})
+                                dcc.Graph(id="time_series", figure=TIME_SERIES_FIGURE, config={'displayModeBar': False})
                             ]
                         )
                 ]
             ),
             html.Div([
 
-                html.H3("Indice de Qualité de l’Air (IQA) par station en 2024"),
-                dcc.Graph(id="rsqa_map", figure=figures5["map"],
+                html.H3("Indice de Qualité de l’Air (IQA) par station en 2024", id="rsqa-title"),
+                dcc.Dropdown(id="rsqa-year", options=[], value=None, clearable=False, searchable=False,
+                             style={"width": "150px", "marginBottom": "5px"}),
+                html.Div("", id="rsqa-progress", className="map-progress", style={"display": "none"}),
+                dcc.Graph(id="rsqa_map", figure=PLACEHOLDER_FIGURE,
                          config={"editable": False,'scrollZoom': False , 'displayModeBar': False}),
             ], className="viz-column-wide")
         ], className="viz-row")
-    ], className="section"),
+    ]),
     # Footer
     html.Footer([
         html.P("© 2025 INF8808 - Visualisation de données", className="footer-text")
@@ -206,193 +343,185 @@ app.layout = html.Div([
                 });
             });
         });
-    """, type="text/javascript")
+    """, type="text/javascript"),
+    # Après les sections : ne décale pas l'alternance .section:nth-child(odd)
+    html.Div(id="lazy-sections-trigger", style={"display": "none"}),
+    dcc.Store(id="sections-observed"),
 ])
 
-### Callback affichage texte surface vegetales
-@app.callback(
-    [Output("pie_chart","figure"),Output('info_veg','children')],
-    Input("map_section1","clickData")  # Change "map" to "map_section1"
+### Callbacks de chargement paresseux des cartes
+def load_section1_map(_):
+    section = get_section(1)
+    return section['figures']["map"], {**section['data']['stats'], "figure": section['figures']["pie"]}
+
+def load_section2_map(_):
+    section = get_section(2)
+    return section['figures']["map"], section['data']['stats']
+
+def load_section3_map(_):
+    return get_section(3)['figures']["territoires_map"]
+
+def load_section4_map(_):
+    return get_section(4)['figures']["map"]
+
+def load_section5_map(_):
+    # Années du cube RSQA ; la carte de l'année choisie est tracée par update_rsqa_map
+    data5 = get_section(5)['data']
+    return [{"label": str(year), "value": year} for year in data5['years']], data5['default_year']
+
+HYDRATION_CALLBACKS = {
+    1: ([Output("map_section1", "figure"), Output("veg-stats", "data")], load_section1_map),
+    2: ([Output("quartiers_map", "figure"), Output("arbres-stats", "data")], load_section2_map),
+    3: (Output("parcs_arrondissement_map", "figure"), load_section3_map),
+    4: (Output("jardins_map", "figure"), load_section4_map),
+    5: ([Output("rsqa-year", "options"), Output("rsqa-year", "value")], load_section5_map),
+}
+
+# Une section est hydratée quand elle approche de la zone visible, pas au chargement
+app.clientside_callback(
+    ClientsideFunction(namespace="montreal", function_name="observe_sections"),
+    Output("sections-observed", "data"),
+    Input("lazy-sections-trigger", "children")
 )
-def update_pie_on_click(clickData):
-    text = dcc.Markdown(f""" 
-                            <div style="text-align:center; font-size:20px;">
-                            Les surfaces végétales sont essentielles à l’environnement et à notre bien-être. 
-                            Elles régulent la température, absorbent le CO₂, réduisent la pollution et favorisent la biodiversité. 
-                            À l’inverse, les surfaces minérales stockent la chaleur et accentuent les îlots de chaleur urbains.
-                            Préserver les espaces verts améliore la qualité de vie et lutte contre le changement climatique.
-                            Cliquez sur un arrondissement pour voir les détails.
-                            </div>""", dangerously_allow_html=True)
-    if not clickData:
-        return figures1['pie'],text
 
-    try:
-        codeid = clickData["points"][0]["location"]
-    except (IndexError, KeyError, TypeError):
-        return figures1['pie'],text
-
-    row_df = data1['df'].loc[data1['df']["CODEID"] == codeid]
-    if row_df.empty:
-        return figures1['pie'],text
-
-    row = row_df.iloc[0]
-    autre_val = row["Eau_km2"] + row["NonCl_km2"]
-
-    new_labels = ["Végétale", "Minérale", "Autres"]
-    new_values = [row["Veg_km2"], row["Min_km2"], autre_val]
-    text = dcc.Markdown(f""" 
-                            <div style="text-align:center; font-size:20px;">
-                            Les surfaces végétales sont essentielles à l’environnement et à notre bien-être. 
-                            Elles régulent la température, absorbent le CO₂, réduisent la pollution et favorisent la biodiversité. 
-                            À l’inverse, les surfaces minérales stockent la chaleur et accentuent les îlots de chaleur urbains.
-                            Préserver les espaces verts améliore la qualité de vie et lutte contre le changement climatique.
-                            L\'arrondissement <b>{row['NOM']}</b> contient de <b>{new_values[0]:.2f}</b> km² de surfaces végétales
-                            contre <b>{new_values[1]:.2f}</b> km² de surfaces minérales.
-                            </div>""", dangerously_allow_html=True)
-    
-    new_fig = go.Figure(data=[
-        go.Pie(
-            labels=new_labels,
-            values=new_values,
-            textinfo="none",
-            texttemplate="%{label}\n%{value:.2f} km²",
-            textposition="outside",
-            marker=dict(colors=["green", "grey", "brown"]),
-            hovertemplate="%{label}: %{value:.2f} km² (%{percent:.1%})<extra></extra>"
+if PRESERIALIZED_RESPONSES:
+    # Sorties encodées une fois, compressées et servies avec un ETag : le
+    # navigateur les récupère par un GET revalidable (304 au retour)
+    for number, (outputs, load_section_map) in HYDRATION_CALLBACKS.items():
+        name = f"section{number}"
+        static_responses.register(name, lambda load_section_map=load_section_map: load_section_map(None))
+        url = app.get_relative_path(f"/static-json/{name}.json")
+        app.clientside_callback(
+            f"function (_) {{ return window.dash_clientside.montreal.fetch_outputs({json.dumps(url)}); }}",
+            outputs,
+            Input(f"section{number}-visible", "data"),
+            prevent_initial_call=True
         )
-    ])
-    new_fig.update_layout(
-        title={
-            "text": f"{row['NOM']}",
-            "x":0.5,
-            "y":0.95,
-            "xanchor":"center",
-            "yanchor":"top"
-        },
-        margin={"t":60},
-        showlegend=False,
-        paper_bgcolor="rgba(0,0,0,0)",  # Fond du papier transparent
-        plot_bgcolor="rgba(0,0,0,0)"
-    )
-    return new_fig,text
-### Callback affichage texte arbres
-@app.callback(
+else:
+    for number, (outputs, load_section_map) in HYDRATION_CALLBACKS.items():
+        app.callback(outputs, Input(f"section{number}-visible", "data"), prevent_initial_call=True)(load_section_map)
+
+### Préchargement (wsgi.py, avant le fork des workers) et disponibilité sur /ready
+def warmup_steps():
+    """Everything a worker would otherwise build on its first requests"""
+    steps = [(f"section{number}", lambda number=number: get_section(number)) for number in SECTIONS]
+    steps += [(f"tiles_{name}", tileset.layers) for name, tileset in tilesets.items()]
+    if PRESERIALIZED_RESPONSES:
+        steps.append(("static_responses", static_responses.warm))
+    # Taille de chaque jeu de données et mémoire du processus, consignées une fois chargés
+    steps.append(("memory_report", lambda: log_memory_report(_loaded_sections)))
+    return steps
+
+startup_warmup = Warmup(warmup_steps())
+init_readiness(server, startup_warmup)
+
+### Callbacks clients : camembert des surfaces végétales et texte des arbres
+app.clientside_callback(
+    ClientsideFunction(namespace="montreal", function_name="update_pie_on_click"),
+    [Output("pie_chart", "figure"), Output("info_veg", "children")],
+    [Input("map_section1", "clickData"), Input("veg-stats", "data")]
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace="montreal", function_name="display_click_info"),
     Output("info", "children"),
-    Input("quartiers_map", "clickData")
+    [Input("quartiers_map", "clickData"), Input("arbres-stats", "data")]
 )
-def display_click_info(clickData):
-    if clickData is None:
-        return dcc.Markdown(f""" 
-                            <div style="text-align:center; font-size:20px;">
-                            Les arbres en milieu urbain offrent de nombreux avantages. 
-                            Ils purifient l'air en absorbant le dioxyde de carbone et les polluants, 
-                            réduisent la chaleur en apportant de l'ombre, et améliorent le bien-être en créant des espaces verts apaisants. 
-                            Ils favorisent la biodiversité et réduisent le bruit, contribuant ainsi à une meilleure qualité de vie en ville. 
-                            Cliquez sur un arrondissement pour voir les détails.
-                            </div>""", dangerously_allow_html=True)
-    try:
-        loc = clickData["points"][0]["location"]
-        df_merged = data2['df_merged']
-        row = df_merged[df_merged["cleaned_name"] == loc].iloc[0]
-        original_name = row["original_name"]
-        total_arbres = int(row["Nombre d'arbres"])
-        arbres_remarquables = int(row["Nombre d'arbres remarquables"])
-        if total_arbres!=0:
-            return dcc.Markdown(f"""
-                                <div style="text-align:center; font-size:20px;">
-                                Les arbres en milieu urbain offrent de nombreux avantages. 
-                                Ils purifient l'air en absorbant le dioxyde de carbone et les polluants, 
-                                réduisent la chaleur en apportant de l'ombre, et améliorent le bien-être en créant des espaces verts apaisants. 
-                                Ils favorisent la biodiversité et réduisent le bruit, contribuant ainsi à une meilleure qualité de vie en ville. 
-                                Dans l'arrondissement <b>{original_name}</b>, on compte <b>{total_arbres}</b> arbres dont <b>{arbres_remarquables}</b> ont été jugés remarquables.
-                                </div>""", dangerously_allow_html=True)
-    
-        else:
-            return dcc.Markdown(f"""
-                                <div style="text-align:center; font-size:20px;">
-                                Les arbres en milieu urbain offrent de nombreux avantages. 
-                                Ils purifient l'air en absorbant le dioxyde de carbone et les polluants, 
-                                réduisent la chaleur en apportant de l'ombre, et améliorent le bien-être en créant des espaces verts apaisants. 
-                                Ils favorisent la biodiversité et réduisent le bruit, contribuant ainsi à une meilleure qualité de vie en ville. 
-                                Malheureusement, dans l'arrondissement <b>{original_name}</b>, l'inventaire des arbres n'a pas été mis à jour.
-                                </div>""", dangerously_allow_html=True)
-    except Exception as e:
-        return f"Erreur lors de la récupération des données : {str(e)}"
-
-# Callback pour mettre à jour la carte et les informations de click
+
+def section_version(number):
+    """Version of the source files of a section, as loaded"""
+    return lambda: get_section(number)['version']
+
+@cached_figure(cache, "parcs_map_territory", version=section_version(3))
+def parcs_map_for_territory(codeid):
+    """Carte des parcs d'un territoire (mise en cache par CODEID)"""
+    data3 = get_section(3)['data']
+    view = data3['territory_views'][codeid]
+    return carte_espaces_verts(data3['df_espaces_verts'].iloc[view["rows"]], view["zoom"], view["center"],
+                               territory_geojson(data3, view["rows"], view["zoom"]))
+
+def background_map_options(name):
+    """Options of a background map callback reporting its progress in `name`"""
+    return dict(
+        background=True,
+        progress=Output(name, "children"),
+        running=[(Output(name, "style"), {"display": "block"}, {"display": "none"})],
+    )
+
+# Section lue par chaque callback en arrière-plan, par composant de sortie. La tâche
+# tourne dans un processus forké depuis le worker : le worker charge la section
+# avant de la lancer, sans quoi chaque tâche la relirait puis la perdrait en sortant
+BACKGROUND_SECTIONS = {"parcs-map-figure": 3, "rsqa_map": 5}
+
+@server.before_request
+def load_background_sections():
+    if not request.path.endswith("_dash-update-component") or "cacheKey" in request.args:
+        return  # pas un lancement de tâche (les interrogations ne forkent pas)
+    body = request.get_json(silent=True) or {}
+    outputs = body.get("outputs", [])
+    for output in outputs if isinstance(outputs, list) else [outputs]:
+        number = BACKGROUND_SECTIONS.get(output.get("id")) if isinstance(output, dict) else None
+        if number is not None:
+            get_section(number)
+
+# Callback pour mettre à jour la carte et les informations de click, en arrière-plan :
+# la figure passe par un dcc.Store, les URL des tuiles sont complétées dans le navigateur
 @app.callback(
-    [Output("espace_verts_map", "figure"), Output("parcs_info", "children")],
-    Input("parcs_arrondissement_map", "clickData"),
+    [Output("parcs-map-figure", "data"), Output("parcs_info", "children")],
+    [Input("parcs_arrondissement_map", "clickData"), Input("section3-visible", "data")],
+    prevent_initial_call=True,
+    **background_map_options("parcs-progress"),
 )
-def update_parcs_map_info(clickData):
+def update_parcs_map_info(set_progress, clickData, _visible):
+    with worker_slot(lambda: set_progress("En attente d'un calcul en cours…")):
+        set_progress("Construction de la carte des parcs…")
+        return parcs_map_info(clickData)
+
+app.clientside_callback(
+    ClientsideFunction(namespace="montreal", function_name="with_tile_urls"),
+    Output("espace_verts_map", "figure"),
+    Input("parcs-map-figure", "data")
+)
+
+def parcs_map_info(clickData):
     base_text = """ Les parcs offrent des lieux de détente, réduisent le stress et améliorent le climat urbain. <br>"""
-                            
+    data3, figures3 = get_section(3)['data'], get_section(3)['figures']
+
     if not clickData:
-        return figures3['espace_verts_map'], dcc.Markdown(f"""
+        return with_tile_layers(figures3['espace_verts_map']), dcc.Markdown(f"""
                                                     {base_text}
                                                     🌱 **Cliquez sur un quartier pour savoir combien de parcs il abrite.**
                                                     """, dangerously_allow_html=True)
 
     try:
         codeid = clickData["points"][0]["location"]
-        print(f"DEBUG: Hovered CODEID: {codeid}")  # Debug statement
+        logger.debug("Clicked CODEID: %s", codeid)
 
-        df_territoires = data3['df_territoires']
-        # Ensure the CODEID in our DataFrame matches what we get from hover
-        print(f"DEBUG: Available CODEIDs: {df_territoires['CODEID'].unique()}")
+        territory_views = data3['territory_views']
 
-        df_espaces_verts = data3['df_espaces_verts']
-        territoires_MTL_Clean_geojson_data = data3['territoires_MTL_Clean_geojson_data']
-        espace_vert_geojson_data = data3['espace_vert_geojson_data']
-        territory_shapes = data3['territory_shapes']
-
-        # Check if the CODEID exists in our territory_shapes dictionary
-        if codeid not in territory_shapes:
-            print(f"DEBUG: CODEID {codeid} not found in territory_shapes")
-            return figures3['espace_verts_map'], dcc.Markdown(f"""
+        # Check if the CODEID exists in our precomputed territory views
+        if codeid not in territory_views:
+            logger.debug("CODEID %s not found in territory_views", codeid)
+            return with_tile_layers(figures3['espace_verts_map']), dcc.Markdown(f"""
                                                     {base_text}
                                                     ❌ **Malheureusement l\'arrondissement'avec CODEID {codeid} n\'a pas été trouvé.**
                                                     """, dangerously_allow_html=True)
 
-        selected_territory = next(
-            (feature for feature in territoires_MTL_Clean_geojson_data["features"]
-             if str(feature["properties"]["CODEID"]) == str(codeid)),
-            None,
-        )
-
-        if not selected_territory:
-            print(f"DEBUG: No territory found for CODEID {codeid}")
-            return figures3['espace_verts_map'], dcc.Markdown(f"""
-                                                    {base_text}
-                                                    ❌ **Aucun arrondissement trouvé**
-                                                    """, dangerously_allow_html=True)
-
-        territory_name = selected_territory["properties"].get("NOM", "Nom inconnu")
-        parc_count = df_territoires.loc[df_territoires["CODEID"] == codeid, "PARC_COUNT"].values[0]
-        superficie = df_territoires.loc[df_territoires["CODEID"] == codeid, "SUPERFICIE"].values[0]
-        hover_text = base_text + f"L'arrondissement: {territory_name} compte {parc_count} parcs pour une superficie totale de {superficie} km²"
+        view = territory_views[codeid]
+        territory_name = view["name"]
+        parc_count = view["parc_count"]
+        superficie = view["superficie"]
         text_info = dcc.Markdown(f"""               {base_text}
                                                     L'arrondissement **{territory_name}** compte **{parc_count}** parcs pour une superficie totale de **{superficie} km²**
                                                     """, dangerously_allow_html=True)
 
-        territory_shape = territory_shapes[codeid]
-        centroid = territory_shape.centroid
-        center = {"lat": centroid.y, "lon": centroid.x}
-
-        filtered_features = [
-            feature for feature in espace_vert_geojson_data["features"]
-            if shape(feature["geometry"]).intersects(territory_shape)
-        ]
-
-        filtered_geojson_data = espace_vert_geojson_data.copy()
-        filtered_geojson_data["features"] = filtered_features
-
-        updated_map = carte_espaces_verts(df_espaces_verts, 12, center, filtered_geojson_data)
+        # Parcs du territoire seulement, en polygones : pas de couches de tuiles de toute la ville
+        updated_map = parcs_map_for_territory(codeid)
         return updated_map, text_info
 
     except (IndexError, KeyError, TypeError) as e:
-        print(f"Error: {e}")
-        return figures3['espace_verts_map'], f"Erreur lors du traitement des données de survol: {str(e)}"
+        logger.warning("Error while handling parcs click: %s", e)
+        return with_tile_layers(figures3['espace_verts_map']), f"Erreur lors du traitement des données de survol: {str(e)}"
     
 ### callback jardins communautaires
 @app.callback(
@@ -415,80 +544,93 @@ def display_jardin_count(clickData):
         """, dangerously_allow_html=True)
 
     try:
-        df = data4["df"]
-        arrondissement = clickData["points"][0]["customdata"][0]  # Extract arrondissement
-        jardin_count = len(df[df["arrondissement"] == arrondissement])
+        point = clickData["points"][0]
+        # Polygone : CODEID dans location ; marqueur : CODEID attribué au chargement
+        codeid = point.get("location") or point["customdata"][2]
+        row = get_section(4)['data']["jardins_counts"][codeid]
+        if not row["jardins"]:
+            raise KeyError(codeid)
 
         return dcc.Markdown(f"""
             {base_text}<br><br>
-            🌿 L'arrondissement <b>{arrondissement}</b> contient <b>{jardin_count}</b> jardins communautaires.
+            🌿 L'arrondissement <b>{row["nom"]}</b> contient <b>{row["jardins"]}</b> jardins communautaires.
             
         """, dangerously_allow_html=True)
 
-    except (KeyError, IndexError):
+    except (KeyError, IndexError, TypeError):
         return dcc.Markdown(f"""
             {base_text}<br><br>
             ❌ **Il ne semble pas y avoir de jardins communautaires par ici, essayez ailleurs.**
             
         """, dangerously_allow_html=True)
 
-### callback time_series pour le RSQA
+### callbacks RSQA : carte de l'année choisie et time_series
+@cached_figure(cache, "rsqa_map", version=section_version(5))
+def rsqa_map_for_year(year):
+    """Carte des stations d'une année (mise en cache par année)"""
+    section = get_section(5)
+    data5 = section['data']
+    if year == data5['default_year']:
+        return section['figures']["map"]
+    return create_rsqa_map(data5['geojson_station_data'], data5['year_views'][year]['df_stats'])
+
 @app.callback(
-    [Output("time_series", "figure"), Output("iqa_journalier",'children')],
-    Input("rsqa_map", "clickData")
+    [Output("rsqa_map", "figure"), Output("rsqa-title", "children")],
+    Input("rsqa-year", "value"),
+    prevent_initial_call=True,
+    **background_map_options("rsqa-progress"),
 )
-def update_time_series(clickData):
-    if not clickData:
-        return go.Figure(), "Cliquez sur une station pour plus de details"
-    
-    station_name = clickData["points"][0]["customdata"][0]
-    df = data5['df']
-    filtered_df = df[df["nom"] == station_name]
-
-    colors = {"Bon": "green", "Acceptable": "orange", "Mauvais": "red"}
-    filtered_df['colors'] = filtered_df['quality_cat'].map(colors)
-    
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=filtered_df["date"], 
-        y=filtered_df["valeur"], 
-        mode="lines",
-        line=dict(color="black", width=2),
-        customdata=filtered_df[["quality_cat", "colors", "polluant"]].values.tolist(),
-        hovertemplate="<b>%{x|%Y-%m-%d}</b><br><span style='background-color:%{customdata[1]}; padding:5px;'>%{customdata[0]} : %{y} indice atteint pour polluant %{customdata[2]}</span><extra></extra>",
-        hoverlabel=dict(
-            bgcolor=filtered_df['colors'],
-            font_size=12,
-            font_color="white" 
-        ),
-    ))
-    fig.update_layout(
-        xaxis=dict(
-            showticklabels=True,
-            tickmode="auto",
-            tickformat="%b",
-            showgrid=True,
-            dtick="M1"
-        )
-    )
-    title = f"IQA journalier de la station {station_name} en 2024"
-    
-    return fig, title
+def update_rsqa_map(set_progress, year):
+    if year is None or year not in get_section(5)['data']['year_views']:
+        return dash.no_update, dash.no_update
+    with worker_slot(lambda: set_progress("En attente d'un calcul en cours…")):
+        set_progress(f"Construction de la carte {year}…")
+        return rsqa_map_for_year(year), f"Indice de Qualité de l’Air (IQA) par station en {year}"
 
 @app.callback(
-    Output('rsqa_map', 'figure'),
-    Input('hidden-div-for-initializing-bars', 'children')
+    [Output("time_series", "figure"), Output("iqa_journalier",'children')],
+    [Input("rsqa_map", "clickData"), Input("rsqa-year", "value")]
 )
-def initialize_bars(_):
-    """Initialize the map with bars once on page load"""
-    map_fig = figures5["map"]
-    stats_df = data5['df_stats']
+def update_time_series(clickData, year):
+    # Mise à jour partielle : seuls les tableaux de la courbe sont envoyés,
+    # la mise en forme reste celle de TIME_SERIES_FIGURE
+    if not clickData or year is None:
+        return time_series_patch(EMPTY_SERIES), "Cliquez sur une station pour plus de details"
     
-    # Add bars for all stations
-    for _, row in stats_df.iterrows():
-        map_fig = add_bars(map_fig, stats_df, row["stationId"], scale=0.00015, min_height=0.0005)
+    station_name = clickData["points"][0]["customdata"][0]
+    patch = time_series_patch(time_series_for_station((station_name, year)))
+    title = f"IQA journalier de la station {station_name} en {year}"
     
-    return map_fig
+    return patch, title
+
+def time_series_patch(series):
+    """Patch remplaçant les tableaux de la courbe IQA par ceux d'une série"""
+    patch = Patch()
+    trace = patch["data"][0]
+    trace["x"] = series["x"]
+    trace["y"] = series["y"]
+    trace["customdata"] = series["customdata"]
+    trace["hoverlabel"]["bgcolor"] = series["colors"]
+    return patch
+
+@cached_figure(cache, "time_series_arrays", version=section_version(5))
+def time_series_for_station(selection):
+    """Tableaux de la série temporelle de l'IQA d'une station pour une année (mise en cache par (nom, année))"""
+    station_name, year = selection
+    view = get_section(5)['data']['year_views'].get(year)
+    series = view['station_series'].get(station_name) if view is not None else None
+    if series is None:
+        return EMPTY_SERIES
+
+    colors = QUALITY_COLORS[series["quality_codes"]]
+    customdata = np.column_stack([
+        QUALITY_CATEGORIES[series["quality_codes"]],
+        colors,
+        view['polluant_labels'][series["polluant_codes"]]
+    ])
+    # Dates au jour près ("2024-01-31") : plus courtes que l'horodatage complet
+    dates = np.datetime_as_string(np.asarray(series["dates"], dtype="datetime64[D]"), unit="D")
+    return {"x": dates, "y": series["values"], "customdata": customdata, "colors": colors}
 
 # Add CSS for the scrollytelling layout
 app.index_string = '''
@@ -585,6 +727,12 @@ app.index_string = '''
                 color: #1a7a1a;
                 text-align: center;
             }
+            .map-progress {
+                text-align: center;
+                font-style: italic;
+                color: #1a7a1a;
+                margin-bottom: 5px;
+            }
             .app-footer {
                 background-color: #125C13;
                 color: white;
@@ -0,0 +1,135 @@
+// Callbacks exécutés dans le navigateur : les statistiques des arrondissements
+// sont précalculées côté serveur et livrées une seule fois dans un dcc.Store.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    montreal: {
+        // Hydratation à la demande : chaque section [data-visible-store] passe son
+        // dcc.Store à true la première fois qu'elle approche de la zone visible
+        observe_sections: function () {
+            const reveal = (element) => window.dash_clientside.set_props(
+                element.dataset.visibleStore, {data: true}
+            );
+            const observe = () => {
+                const sections = document.querySelectorAll("[data-visible-store]");
+                if (!sections.length) {
+                    window.requestAnimationFrame(observe);  // layout pas encore monté
+                    return;
+                }
+                if (!("IntersectionObserver" in window)) {
+                    sections.forEach(reveal);
+                    return;
+                }
+                const observer = new IntersectionObserver((entries) => {
+                    entries.forEach((entry) => {
+                        if (entry.isIntersecting) {
+                            observer.unobserve(entry.target);
+                            reveal(entry.target);
+                        }
+                    });
+                }, {rootMargin: "200px 0px"});
+                sections.forEach((section) => observer.observe(section));
+            };
+            observe();
+            return true;
+        },
+
+        // Sorties d'un callback d'hydratation, pré-sérialisées par le serveur
+        fetch_outputs: async function (url) {
+            const response = await fetch(url, {credentials: "same-origin"});
+            if (!response.ok) {
+                throw new Error("Chargement de " + url + " impossible (" + response.status + ")");
+            }
+            return response.json();
+        },
+
+        // Carte des parcs (section 3) : les URL de tuiles relatives sont rendues
+        // absolues, mapbox-gl les résolvant dans un worker sans base
+        with_tile_urls: function (figure) {
+            if (!figure) {
+                return window.dash_clientside.no_update;
+            }
+            const origin = window.location.origin;
+            const layers = (figure.layout.mapbox.layers || []).map((layer) => Object.assign({}, layer, {
+                source: [].concat(layer.source).map((url) => url.startsWith("/") ? origin + url : url)
+            }));
+            return Object.assign({}, figure, {
+                layout: Object.assign({}, figure.layout, {
+                    mapbox: Object.assign({}, figure.layout.mapbox, {layers: layers})
+                })
+            });
+        },
+
+        // Camembert et texte des surfaces végétales (section 1)
+        update_pie_on_click: function (clickData, vegStats) {
+            const intro =
+                "Les surfaces végétales sont essentielles à l’environnement et à notre bien-être. " +
+                "Elles régulent la température, absorbent le CO₂, réduisent la pollution et favorisent la biodiversité. " +
+                "À l’inverse, les surfaces minérales stockent la chaleur et accentuent les îlots de chaleur urbains. " +
+                "Préserver les espaces verts améliore la qualité de vie et lutte contre le changement climatique. ";
+            const wrap = (body) => '<div style="text-align:center; font-size:20px;">' + intro + body + "</div>";
+            const defaultText = wrap("Cliquez sur un arrondissement pour voir les détails.");
+
+            if (!vegStats) {
+                return [window.dash_clientside.no_update, defaultText];
+            }
+
+            let codeid = vegStats.initial;
+            let clicked = false;
+            if (clickData && clickData.points && clickData.points.length) {
+                const location = String(clickData.points[0].location);
+                if (location in vegStats.stats) {
+                    codeid = location;
+                    clicked = true;
+                }
+            }
+
+            // Mise à jour partielle : seuls les trois valeurs et le titre changent,
+            // le reste de la figure du Store est partagé (pas de copie profonde)
+            const row = vegStats.stats[codeid];
+            const template = vegStats.figure;
+            const figure = Object.assign({}, template, {
+                data: [Object.assign({}, template.data[0], {values: [row.veg, row.min, row.autres]})]
+                    .concat(template.data.slice(1)),
+                layout: Object.assign({}, template.layout, {
+                    title: Object.assign({}, template.layout.title, {text: row.nom})
+                })
+            });
+
+            if (!clicked) {
+                return [figure, defaultText];
+            }
+            return [figure, wrap(
+                "L'arrondissement <b>" + row.nom + "</b> contient de <b>" + row.veg.toFixed(2) +
+                "</b> km² de surfaces végétales contre <b>" + row.min.toFixed(2) + "</b> km² de surfaces minérales."
+            )];
+        },
+
+        // Texte des arbres urbains (section 2)
+        display_click_info: function (clickData, arbresStats) {
+            const intro =
+                "Les arbres en milieu urbain offrent de nombreux avantages. " +
+                "Ils purifient l'air en absorbant le dioxyde de carbone et les polluants, " +
+                "réduisent la chaleur en apportant de l'ombre, et améliorent le bien-être en créant des espaces verts apaisants. " +
+                "Ils favorisent la biodiversité et réduisent le bruit, contribuant ainsi à une meilleure qualité de vie en ville. ";
+            const wrap = (body) => '<div style="text-align:center; font-size:20px;">' + intro + body + "</div>";
+
+            if (!clickData || !arbresStats) {
+                return wrap("Cliquez sur un arrondissement pour voir les détails.");
+            }
+            const location = String(clickData.points[0].location);
+            const row = arbresStats.stats[location];
+            if (!row) {
+                return "Erreur lors de la récupération des données : arrondissement " + location + " inconnu";
+            }
+            if (row.arbres !== 0) {
+                return wrap(
+                    "Dans l'arrondissement <b>" + row.nom + "</b>, on compte <b>" + row.arbres +
+                    "</b> arbres dont <b>" + row.remarquables + "</b> ont été jugés remarquables."
+                );
+            }
+            return wrap(
+                "Malheureusement, dans l'arrondissement <b>" + row.nom +
+                "</b>, l'inventaire des arbres n'a pas été mis à jour."
+            );
+        }
+    }
+});
@@ -0,0 +1,79 @@
+"""
+Exécution en arrière-plan des callbacks lourds.
+
+Les callbacks qui reconstruisent une carte (filtrage des géométries, figure
+Plotly complète) ne tournent plus sur le thread de requête : Dash lance chaque
+tâche dans un processus à part, dont la progression et le résultat transitent
+par un cache diskcache sur disque, et la page interroge ce résultat. Le worker
+gunicorn est libéré aussitôt pour les callbacks légers.
+
+Au plus BACKGROUND_WORKERS tâches calculent en même temps sur la machine : les
+suivantes attendent un créneau, un verrou de fichier que le noyau libère même
+si la tâche est tuée. Une tâche remplacée par un nouveau clic sur la même
+entrée est annulée par Dash (le navigateur envoie l'identifiant de l'ancienne
+tâche avec la nouvelle requête).
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import diskcache
+from dash import DiskcacheManager
+
+try:
+    import fcntl
+except ImportError:  # Windows (waitress) : pas de borne sur le nombre de tâches
+    fcntl = None
+
+BACKGROUND_CACHE_DIR = os.environ.get(
+    "BACKGROUND_CACHE_DIR", os.path.join(tempfile.gettempdir(), "montreal-background")
+)
+SLOT_DIR = BACKGROUND_CACHE_DIR + "-slots"
+JOB_STARTS_DIR = BACKGROUND_CACHE_DIR + "-starts"
+BACKGROUND_WORKERS = max(1, int(os.environ.get("BACKGROUND_WORKERS", 2)))
+# Résultats jamais relus (onglet fermé) : supprimés après ce délai (secondes)
+RESULT_EXPIRE = 600
+SLOT_POLL_INTERVAL = 0.05
+
+
+def create_background_manager():
+    """Background callback manager storing progress and results on local disk"""
+    return DiskcacheManager(diskcache.Cache(BACKGROUND_CACHE_DIR), expire=RESULT_EXPIRE)
+
+
+def job_start_store():
+    """Dispatch time of the running jobs, shared by the workers of the machine (for the metrics)"""
+    return diskcache.Cache(JOB_STARTS_DIR)
+
+
+@contextmanager
+def worker_slot(on_wait=None):
+    """
+    Hold one of the BACKGROUND_WORKERS computation slots for the duration of
+    the block. `on_wait()` is called once if every slot is taken, before
+    waiting for one to be released.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(SLOT_DIR, exist_ok=True)
+    waiting = False
+    while True:
+        for index in range(BACKGROUND_WORKERS):
+            slot_file = open(os.path.join(SLOT_DIR, f"slot-{index}.lock"), "a")
+            try:
+                fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                slot_file.close()
+                continue
+            try:
+                yield
+            finally:
+                fcntl.flock(slot_file, fcntl.LOCK_UN)
+                slot_file.close()
+            return
+        if not waiting and on_wait is not None:
+            on_wait()
+            waiting = True
+        time.sleep(SLOT_POLL_INTERVAL)
@@ -0,0 +1,261 @@
+"""
+Benchmarks of the page loaders, figure builders and server callbacks.
+
+Each case is timed (best wall time over --repeat runs, without tracing), its
+peak Python memory is measured with tracemalloc in one more, separate run (the
+tracing slows every allocation down and would skew the times) and the size of
+its JSON-serialized result (what Dash would send to the browser) is recorded.
+Results can be saved as a baseline and later runs fail when any metric
+regresses by more than --threshold.
+
+    python benchmark.py --save-baseline      # record benchmark_baseline.json
+    python benchmark.py                      # compare against the baseline
+    python benchmark.py --cold-disk          # also rebuild the derived files
+
+Every run starts with empty in-memory caches and an empty figure cache. By
+default the files the loaders derive from the sources and reuse across starts
+(reprojected layers, park/territory table, crosswalk) are left on disk, so
+loader cases are measured warm-disk, as a restarted worker runs them;
+--cold-disk deletes them before every run to measure a first start. The RSQA
+cube is an input built by optimize_data.py: it is always read, never rebuilt.
+
+Clientside callbacks (section 1 pie, section 2 text) run in the browser and are
+covered through the size of the stores that feed them (load_section1_map,
+load_section2_map). Background callbacks (update_parcs_map_info, update_rsqa_map)
+are called directly, in this process, as their job would run them.
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Caches de figures et de tuiles isolés : les callbacks sont mesurés sans cache chaud
+_cache_root = tempfile.mkdtemp()
+os.environ.setdefault("FIGURE_CACHE_DIR", os.path.join(_cache_root, "figure-cache"))
+os.environ.setdefault("TILE_CACHE_DIR", os.path.join(_cache_root, "tiles"))
+
+from plotly.utils import PlotlyJSONEncoder
+
+import app
+import boundaries
+from crosswalk import CROSSWALK_FILE
+from reprojection import REPROJECTED_DIR
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+METRICS = ("wall_time", "peak_memory", "payload_bytes")
+
+
+def remove_derived_files():
+    """Delete the files the loaders derive from the sources (rebuilt on the next load)"""
+    data_dir = os.path.dirname(boundaries.data_path("montreal.json"))
+    shutil.rmtree(os.path.join(data_dir, REPROJECTED_DIR), ignore_errors=True)
+    derived = glob.glob(os.path.join(data_dir, "optimized", "parcs_territoires*.csv"))
+    for path in derived + [os.path.join(data_dir, CROSSWALK_FILE)]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def reset_caches(cold_disk=False):
+    """
+    Forget everything memoized in memory between runs, and with `cold_disk`
+    the derived files on disk too
+    """
+    boundaries._load_source.cache_clear()
+    boundaries._load_display_geojson.cache_clear()
+    boundaries._get_boundaries.cache_clear()
+    boundaries._spatial_index.cache_clear()
+    app._loaded_sections.clear()
+    app.cache.clear()
+    if cold_disk:
+        remove_derived_files()
+
+
+def payload_size(result):
+    """Size in bytes of a result once serialized like a Dash response"""
+    return len(json.dumps(result, cls=PlotlyJSONEncoder).encode("utf-8"))
+
+
+def prepare(func, cold_disk=False):
+    """Start a run of func: clear the caches, then run its setup step"""
+    reset_caches(cold_disk)
+    setup = getattr(func, "setup", None)
+    if setup is not None:
+        setup()
+
+
+def measure(func, repeat, cold_disk=False):
+    """Return best wall time (untraced runs), peak traced memory (one traced run) and payload size of func()"""
+    best_time = float("inf")
+    result = None
+    for _ in range(repeat):
+        prepare(func, cold_disk)
+        start = time.perf_counter()
+        result = func()
+        best_time = min(best_time, time.perf_counter() - start)
+
+    prepare(func, cold_disk)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "wall_time": best_time,
+        "peak_memory": peak_memory,
+        # Les loaders retournent des DataFrames : pas de charge utile à mesurer
+        "payload_bytes": payload_size(result) if getattr(func, "payload", True) else 0,
+    }
+
+
+def with_setup(func, setup):
+    """Attach a setup step that runs before each (untimed) measurement"""
+    func.setup = setup
+    return func
+
+
+def figures_only(figures):
+    """Keep the figures of a create_pageN_figures result (some also return frames)"""
+    return {name: fig for name, fig in figures.items() if hasattr(fig, "to_plotly_json")}
+
+
+def without_payload(func):
+    """Mark a case whose result is not sent to the browser"""
+    func.payload = False
+    return func
+
+
+def in_request(callback):
+    """Run a callback inside a Flask request context, as Dash does"""
+    def run():
+        with app.server.test_request_context():
+            return callback()
+    return run
+
+
+def no_progress(_):
+    """set_progress of a background callback called directly (no job, nothing to report)"""
+
+
+def build_cases():
+    """Benchmark cases: name -> zero-argument callable"""
+    loaders = {number: loader for number, (loader, _) in app.SECTIONS.items()}
+    builders = {number: builder for number, (_, builder) in app.SECTIONS.items()}
+    cases = {}
+
+    for number in app.SECTIONS:
+        cases[f"load_page{number}_data"] = without_payload(lambda number=number: loaders[number]())
+        state = {}
+        cases[f"create_page{number}_figures"] = with_setup(
+            lambda number=number, state=state: figures_only(builders[number](state["data"])),
+            lambda number=number, state=state: state.update(data=loaders[number]())
+        )
+
+    # Données des sections déjà chargées : seuls les callbacks sont mesurés
+    def warm_sections():
+        for number in app.SECTIONS:
+            app.get_section(number)
+
+    def first_territory():
+        return next(iter(app.get_section(3)['data']['territory_views']))
+
+    def first_station():
+        return app.get_section(5)['data']['df_stats']["nom"].iloc[0]
+
+    def first_garden():
+        return app.get_section(4)['data']['df'][["arrondissement", "adresse", "CODEID"]].iloc[0].tolist()
+
+    callbacks = {
+        "load_section1_map": lambda: app.load_section1_map(None),
+        "load_section2_map": lambda: app.load_section2_map(None),
+        "load_section3_map": lambda: app.load_section3_map(None),
+        "load_section4_map": lambda: app.load_section4_map(None),
+        "load_section5_map": lambda: app.load_section5_map(None),
+        "update_parcs_map_info": lambda: app.update_parcs_map_info(
+            no_progress, {"points": [{"location": first_territory()}]}, True
+        ),
+        "display_jardin_count": lambda: app.display_jardin_count(
+            {"points": [{"customdata": first_garden()}]}
+        ),
+        "update_rsqa_map": lambda: app.update_rsqa_map(no_progress, app.get_section(5)['data']['default_year']),
+        "update_time_series": lambda: app.update_time_series(
+            {"points": [{"customdata": [first_station()]}]}, app.get_section(5)['data']['default_year']
+        ),
+    }
+    for name, callback in callbacks.items():
+        cases[name] = with_setup(in_request(callback), warm_sections)
+
+    return cases
+
+
+def compare(results, baseline, threshold, min_time):
+    """Return the list of regressions of results against baseline"""
+    regressions = []
+    for name, metrics in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for metric in METRICS:
+            old, new = reference[metric], metrics[metric]
+            if metric == "wall_time" and new < min_time:
+                continue
+            if old > 0 and new > old * (1 + threshold):
+                regressions.append(f"{name}: {metric} {old:.6g} -> {new:.6g} (+{new / old - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loaders, figure builders and callbacks")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="record the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative regression per metric (default: 0.2 = 20%%)")
+    parser.add_argument("--min-time", type=float, default=0.005,
+                        help="ignore wall time regressions of cases faster than this (seconds)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, best wall time is kept")
+    parser.add_argument("--cold-disk", action="store_true",
+                        help="delete the derived files (reprojections, tables) before every run")
+    parser.add_argument("cases", nargs="*", help="only run these cases")
+    args = parser.parse_args()
+
+    cases = build_cases()
+    unknown = [name for name in args.cases if name not in cases]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)} (available: {', '.join(cases)})")
+    selected = args.cases or list(cases)
+    results = {}
+    for name in selected:
+        results[name] = measure(cases[name], args.repeat, args.cold_disk)
+        m = results[name]
+        print(f"{name:28s} {m['wall_time'] * 1000:10.1f} ms {m['peak_memory'] / 2**20:10.1f} MiB "
+              f"{m['payload_bytes'] / 1024:10.1f} KiB")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline first")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold, args.min_time)
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("No regression")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
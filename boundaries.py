@@ -0,0 +1,126 @@
+"""
+Registre partagé des limites d'arrondissements.
+
+Chaque jeu de limites est lu une seule fois par processus puis partagé, en
+lecture seule, par toutes les pages : identifiants canoniques (CODEID en
+chaîne), noms, formes Shapely préparées (pleine résolution, pour les calculs
+spatiaux) et GeoJSON d'affichage (variante simplifiée adaptée au zoom).
+Les objets retournés ne doivent pas être modifiés.
+"""
+import json
+import os
+import threading
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
+import shapely
+
+from reprojection import read_reprojected, read_reprojected_geojson
+from zoom_variants import band_for_zoom, find_variant
+
+# Jeux de limites disponibles
+BOUNDARY_FILES = {
+    "montreal": "montreal.json",
+    "updated_montreal": "updated_montreal.json",
+    "taux_veg": "taux_veg.geojson",
+}
+
+_lock = threading.Lock()
+
+
+def data_path(filename):
+    """Path of a file of the data directory, from the main directory or a page directory"""
+    if os.path.exists(os.path.join("data", filename)):
+        return os.path.join("data", filename)
+    return os.path.join("..", "data", filename)
+
+
+def canonical_id(value):
+    """CODEID as a string, without the '.0' of values read as floats"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+@lru_cache(maxsize=None)
+def _load_source(name):
+    """Read a boundary set at full resolution, reprojected to EPSG:4326"""
+    gdf = read_reprojected(data_path(BOUNDARY_FILES[name]))
+
+    ids = tuple(canonical_id(codeid) for codeid in gdf["CODEID"])
+    geometries = np.asarray(gdf.geometry.values, dtype=object)
+    shapely.prepare(geometries)
+    properties = tuple(
+        MappingProxyType(row)
+        for row in gdf.drop(columns="geometry").to_dict(orient="records")
+    )
+    return ids, geometries, properties
+
+
+@lru_cache(maxsize=None)
+def _load_display_geojson(name, band):
+    """GeoJSON sent to the browser: simplified variant of the band if it was built"""
+    source_path = data_path(BOUNDARY_FILES[name])
+    path = find_variant(source_path, band)
+    if path == source_path:
+        return read_reprojected_geojson(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def _get_boundaries(name, band):
+    ids, geometries, properties = _load_source(name)
+    return MappingProxyType({
+        'ids': ids,
+        'names': MappingProxyType({codeid: props.get("NOM") for codeid, props in zip(ids, properties)}),
+        'properties': properties,
+        'geometries': geometries,
+        'shapes': MappingProxyType(dict(zip(ids, geometries))),
+        'geojson_data': _load_display_geojson(name, band),
+    })
+
+
+def get_boundaries(name="montreal", zoom=9):
+    """
+    Return the shared registry entry of a boundary set:
+
+    - ids: canonical CODEIDs (strings), in file order
+    - names: CODEID -> NOM
+    - properties: read-only properties of each feature, aligned with ids
+    - geometries / shapes: prepared full-resolution Shapely geometries
+      (array aligned with ids / mapping by CODEID)
+    - geojson_data: GeoJSON to display at `zoom`
+    """
+    with _lock:
+        return _get_boundaries(name, band_for_zoom(zoom))
+
+
+@lru_cache(maxsize=None)
+def _spatial_index(name):
+    """STRtree over the full-resolution geometries of a boundary set"""
+    _, geometries, _ = _load_source(name)
+    return shapely.STRtree(geometries)
+
+
+def locate_points(name, lon, lat):
+    """
+    CODEID of the boundary containing each lon/lat point (None outside every
+    boundary). The STRtree gives the candidate boundaries of every point in
+    one query (bounding boxes), then the predicate is evaluated vectorized
+    with the prepared boundary geometries as the prepared side.
+    """
+    with _lock:
+        ids, geometries, _ = _load_source(name)
+        tree = _spatial_index(name)
+    points = shapely.points(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+    # query(..., predicate=) préparerait les points, pas les limites déjà préparées
+    point_idx, boundary_idx = tree.query(points)
+    hit = shapely.intersects(geometries[boundary_idx], points[point_idx])
+    point_idx, boundary_idx = point_idx[hit], boundary_idx[hit]
+    codeids = np.full(len(points), None, dtype=object)
+    # Un point sur une limite commune est attribué au premier arrondissement trouvé
+    first = np.unique(point_idx, return_index=True)[1]
+    codeids[point_idx[first]] = np.asarray(ids, dtype=object)[boundary_idx[first]]
+    return codeids
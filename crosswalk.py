@@ -0,0 +1,136 @@
+"""
+Table de correspondance des noms d'arrondissements vers un identifiant canonique.
+
+Chaque jeu de données écrit les noms à sa façon (accents, tirets demi-cadratins,
+casse, « Saint »/« St », encodage cassé de updated_montreal.json). Les noms sont
+d'abord normalisés (`fold_name`), puis rapprochés des noms de référence par une
+seule matrice de similarité `rapidfuzz.process.cdist`. Le résultat, un CODEID
+entier de montreal.json par (source, nom), est écrit dans
+data/optimized/crosswalk.csv et reconstruit seulement si une source change :
+les pages joignent ensuite sur cet entier.
+"""
+import json
+import os
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from boundaries import data_path
+
+CROSSWALK_FILE = os.path.join("optimized", "crosswalk.csv")
+# Score minimal (0-100) pour accepter un rapprochement approximatif
+SCORE_CUTOFF = 85
+
+# Les arrondissements de référence : CODEID et NOM de montreal.json
+REFERENCE = ("montreal.json", "NOM")
+# Sources rapprochées : nom -> (fichier du dossier data, colonne ou propriété du nom)
+SOURCES = {
+    "montreal": REFERENCE,
+    "updated_montreal": ("updated_montreal.json", "NOM"),
+    "taux_veg": ("taux_veg.geojson", "NOM"),
+    "arbres": (os.path.join("optimized", "arbres_aggregated.csv"), "ARROND_NOM"),
+    "jardins": ("jardins-communautaires.csv", "arrondissement"),
+    "stations": ("liste-des-stations-rsqa.csv", "arrondissement_ville"),
+}
+
+# Abréviations courantes, développées avant la comparaison
+ABBREVIATIONS = {"st": "saint", "ste": "sainte"}
+
+
+def fold_name(name):
+    """
+    Normalized form of a place name: mis-decoded UTF-8 repaired, accents
+    removed, lower case, punctuation and dashes dropped, abbreviations expanded.
+    """
+    if not isinstance(name, str):
+        return ""
+    try:
+        # Texte UTF-8 relu en cp1252 (« MontrÃ©al ») : on le répare
+        name = name.encode("cp1252").decode("utf-8")
+    except UnicodeError:
+        pass
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c)).lower()
+    tokens = re.findall(r"[a-z0-9]+", name)
+    return "".join(ABBREVIATIONS.get(token, token) for token in tokens)
+
+
+def match_names(names, reference_names, score_cutoff=SCORE_CUTOFF):
+    """
+    Index in `reference_names` of the best match of each name, computed with
+    one vectorized similarity matrix. Returns (indices, scores); indices are -1
+    where no reference reaches `score_cutoff`.
+    """
+    queries = [fold_name(name) for name in names]
+    choices = [fold_name(name) for name in reference_names]
+    if not queries or not choices:
+        return np.full(len(queries), -1), np.zeros(len(queries))
+    scores = process.cdist(queries, choices, scorer=fuzz.ratio, dtype=np.uint8, workers=-1)
+    best = scores.argmax(axis=1)
+    best_scores = scores[np.arange(len(queries)), best]
+    return np.where(best_scores >= score_cutoff, best, -1), best_scores
+
+
+def _read_names(filename, column):
+    """Distinct names of a source file (GeoJSON property or CSV column)"""
+    path = data_path(filename)
+    if path.endswith((".json", ".geojson")):
+        with open(path, "r", encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        values = [feature["properties"].get(column) for feature in features]
+    else:
+        values = pd.read_csv(path, usecols=[column])[column].tolist()
+    return pd.unique(pd.Series([v for v in values if isinstance(v, str)]))
+
+
+def _reference():
+    """CODEID (int) and names of the reference arrondissements"""
+    filename, column = REFERENCE
+    with open(data_path(filename), "r", encoding="utf-8") as f:
+        properties = [feature["properties"] for feature in json.load(f)["features"]]
+    codeids = np.array([int(float(props["CODEID"])) for props in properties])
+    return codeids, [props[column] for props in properties]
+
+
+def build_crosswalk():
+    """Match the names of every available source and return the crosswalk table"""
+    codeids, reference_names = _reference()
+    frames = []
+    for source, (filename, column) in SOURCES.items():
+        if not os.path.exists(data_path(filename)):
+            continue
+        names = _read_names(filename, column)
+        indices, scores = match_names(names, reference_names)
+        frames.append(pd.DataFrame({
+            "source": source,
+            "name": names,
+            "CODEID": pd.Series(codeids[np.maximum(indices, 0)], dtype="Int64").mask(indices < 0),
+            "score": scores,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_crosswalk():
+    """Crosswalk table, read from data/optimized/ or rebuilt if a source changed"""
+    path = os.path.join(os.path.dirname(data_path(REFERENCE[0])), CROSSWALK_FILE)
+    sources = [data_path(filename) for filename, _ in SOURCES.values()]
+    newest_source = max(os.path.getmtime(p) for p in sources if os.path.exists(p))
+    if os.path.exists(path) and os.path.getmtime(path) >= newest_source:
+        return pd.read_csv(path, dtype={"CODEID": "Int64"}, keep_default_na=False, na_values=[""])
+
+    crosswalk = build_crosswalk()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    crosswalk.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return crosswalk
+
+
+def codeid_lookup(source):
+    """{name: CODEID} for the names of one source that were matched"""
+    crosswalk = load_crosswalk()
+    rows = crosswalk[(crosswalk["source"] == source) & crosswalk["CODEID"].notna()]
+    return dict(zip(rows["name"], rows["CODEID"].astype(int)))
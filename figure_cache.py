@@ -0,0 +1,112 @@
+"""
+Cache des figures partagé entre les workers gunicorn.
+
+Les figures des callbacks lourds ne dépendent que de la sélection (CODEID,
+nom de station) et des fichiers de données dont elles sont tirées : la clé
+combine la sélection et une version de ces fichiers (date de modification et
+taille), si bien qu'une figure est recalculée après une mise à jour des
+données au lieu d'être resservie depuis un cache antérieur.
+
+Les figures sont stockées dans un cache Flask-Caching sur disque, visible par
+tous les workers, dont la taille est bornée (les entrées les plus anciennes
+sont évincées au-delà de FIGURE_CACHE_THRESHOLD). Un verrou de fichier garantit
+qu'une figure demandée simultanément par plusieurs clics n'est calculée qu'une
+seule fois : les clés sont réparties sur LOCK_STRIPES verrous fixes (un verrou
+de thread et un fichier chacun), dont le nombre ne croît pas avec les clés.
+"""
+import functools
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from flask_caching import Cache
+
+try:
+    import fcntl
+except ImportError:  # Windows (waitress) : verrou limité au processus
+    fcntl = None
+
+CACHE_DIR = os.environ.get(
+    "FIGURE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "montreal-figure-cache")
+)
+LOCK_DIR = CACHE_DIR + "-locks"
+# Verrous partagés par les clés : deux clés du même verrou se calculent l'une après l'autre
+LOCK_STRIPES = 64
+CACHE_CONFIG = {
+    "CACHE_TYPE": "FileSystemCache",
+    "CACHE_DIR": CACHE_DIR,
+    "CACHE_THRESHOLD": int(os.environ.get("FIGURE_CACHE_THRESHOLD", 500)),
+    "CACHE_DEFAULT_TIMEOUT": 0,
+}
+
+_thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def create_cache(server):
+    """Attach the shared figure cache to the Flask server"""
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    return Cache(server, config=CACHE_CONFIG)
+
+
+def data_version(paths):
+    """Short digest of the modification time and size of the existing `paths`"""
+    stamps = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        stamps.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+    return hashlib.sha1(str(stamps).encode("utf-8")).hexdigest()[:12]
+
+
+def cache_key(prefix, selection, version=""):
+    """Stable key for a normalized selection of a given data version"""
+    digest = hashlib.sha1(str(selection).encode("utf-8")).hexdigest()
+    return f"{prefix}-{version}-{digest}" if version else f"{prefix}-{digest}"
+
+
+@contextmanager
+def _key_lock(key):
+    """Exclusive lock on the stripe of a key, across threads and (when fcntl exists) processes"""
+    stripe = int(hashlib.sha1(key.encode("utf-8")).hexdigest(), 16) % LOCK_STRIPES
+    with _thread_locks[stripe]:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(LOCK_DIR, f"stripe-{stripe}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def cached_figure(cache, prefix, version=None):
+    """
+    Decorator memoizing a figure builder taking a single normalized selection
+    in the shared cache. Figures are stored (and returned) as plain dicts.
+    `version()`, if given, returns the version of the data the figure is
+    built from: it is part of the key, so that entries of older data are no
+    longer read (they are evicted with the oldest ones). Concurrent misses on
+    the same key wait for the first computation instead of running it again.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(selection):
+            key = cache_key(prefix, selection, version() if version is not None else "")
+            value = cache.get(key)
+            if value is None:
+                with _key_lock(key):
+                    value = cache.get(key)
+                    if value is None:
+                        value = func(selection)
+                        # Dict plutôt qu'un go.Figure : pas de revalidation au chargement
+                        if hasattr(value, "to_plotly_json"):
+                            value = value.to_plotly_json()
+                        cache.set(key, value)
+            return value
+        return wrapper
+    return decorator
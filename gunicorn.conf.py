@@ -0,0 +1,5 @@
+# Configuration gunicorn, lue automatiquement depuis le dossier de lancement.
+# L'application est chargée dans le processus maître avant le fork (wsgi.py) :
+# les workers partagent ses données au lieu d'en construire chacun une copie.
+wsgi_app = "wsgi:server"
+preload_app = True
@@ -0,0 +1,138 @@
+"""
+Empreinte mémoire des données chargées.
+
+Mode économe (LEAN_DATA, activé par défaut ; LEAN_DATA=0 pour le désactiver) :
+les tables ne gardent que les colonnes affichées, sans géométrie, avec des
+types compacts (catégories pour les chaînes répétées, entiers réduits, float32
+pour les mesures). Chaque jeu de géométries n'existe qu'en un exemplaire,
+partagé par les calculs et les tuiles.
+
+Au démarrage, la taille estimée de chaque jeu de données des sections
+(DataFrames en profondeur, tableaux NumPy, géométries Shapely, GeoJSON,
+figures) est consignée, avec la mémoire du processus : RSS, et USS, les pages
+propres au processus, celles qu'un worker ne partage pas avec le maître.
+"""
+import logging
+import os
+import sys
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+import shapely
+
+try:
+    import psutil
+except ImportError:  # pas de mesure de la mémoire du processus
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+LEAN_DATA = os.environ.get("LEAN_DATA", "1") != "0"
+# Une colonne de chaînes devient catégorielle si elle a au plus cette part de valeurs distinctes
+CATEGORY_MAX_RATIO = 0.5
+# Coût estimé d'une géométrie GEOS : en-tête et coordonnées (x, y)
+GEOMETRY_OVERHEAD = 64
+COORDINATE_BYTES = 16
+
+
+def compact_frame(df, float32_columns=()):
+    """
+    Copy of `df` with compact dtypes (no-op unless LEAN_DATA): repeated strings
+    as categories, integers downcast, `float32_columns` as float32.
+    """
+    if not LEAN_DATA:
+        return df
+    df = df.copy()
+    for column in df.columns:
+        values = df[column]
+        if column in float32_columns:
+            df[column] = values.astype("float32")
+        elif pd.api.types.is_integer_dtype(values.dtype) and not isinstance(values.dtype, pd.CategoricalDtype):
+            df[column] = pd.to_numeric(values, downcast="integer")
+        elif values.dtype == object and values.map(type).eq(str).all():
+            if values.nunique() <= CATEGORY_MAX_RATIO * len(values):
+                df[column] = values.astype("category")
+    return df
+
+
+def _geometry_size(geometries):
+    geometries = np.asarray(geometries, dtype=object)
+    return int(shapely.get_num_coordinates(geometries).sum()) * COORDINATE_BYTES \
+        + len(geometries) * GEOMETRY_OVERHEAD
+
+
+def deep_size(value, seen=None):
+    """
+    Estimated bytes held by `value` and what it references, each object
+    counted once per `seen` set (share it to count shared objects once).
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        size = value.memory_usage(deep=True)
+        size = int(size.sum()) if isinstance(value, pd.DataFrame) else int(size)
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        for column in frame.columns:
+            if getattr(frame[column].dtype, "name", None) == "geometry":
+                size += _geometry_size(frame[column].values)
+        return size
+    if isinstance(value, np.ndarray):
+        if value.dtype != object:
+            return value.nbytes
+        return value.nbytes + sum(deep_size(item, seen) for item in value.ravel())
+    if isinstance(value, shapely.Geometry):
+        return _geometry_size([value])
+    if hasattr(value, "to_plotly_json"):
+        # Figures Plotly : dictionnaires internes, sans la copie de to_plotly_json
+        return sys.getsizeof(value) + deep_size(getattr(value, "_data", []), seen) \
+            + deep_size(getattr(value, "_layout", {}), seen)
+    if isinstance(value, (dict, MappingProxyType)):
+        return sys.getsizeof(value) + sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(deep_size(item, seen) for item in value)
+    return sys.getsizeof(value)
+
+
+def dataset_sizes(data, seen=None):
+    """{key: estimated bytes} of a section data dict, largest first"""
+    if seen is None:
+        seen = set()
+    sizes = {key: deep_size(value, seen) for key, value in data.items()}
+    return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+
+
+def process_memory():
+    """{"rss": bytes, "uss": bytes} of the current process (empty without psutil)"""
+    if psutil is None:
+        return {}
+    process = psutil.Process()
+    try:
+        info = process.memory_full_info()
+        return {"rss": info.rss, "uss": info.uss}
+    except (psutil.AccessDenied, AttributeError):
+        return {"rss": process.memory_info().rss}
+
+
+def _mib(size):
+    return f"{size / 2**20:.1f} MiB"
+
+
+def log_memory_report(sections):
+    """Log the estimated size of every dataset of `sections` ({number: section}) and the process memory"""
+    seen = set()  # limites partagées entre sections : comptées une fois, dans la première
+    for number, section in sorted(sections.items()):
+        sizes = dataset_sizes(section['data'], seen)
+        figures = deep_size(section['figures'], seen)
+        logger.info("Section %s: data %s, figures %s (lean=%s)",
+                    number, _mib(sum(sizes.values())), _mib(figures), LEAN_DATA)
+        for key, size in sizes.items():
+            logger.info("  %-32s %s", key, _mib(size))
+    memory = process_memory()
+    if memory:
+        logger.info("Process %d memory: %s", os.getpid(),
+                    ", ".join(f"{name} {_mib(size)}" for name, size in memory.items()))
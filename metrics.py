@@ -0,0 +1,157 @@
+"""
+Mesures des callbacks Dash, exposées au format texte Prometheus.
+
+Chaque requête `_dash-update-component` est chronométrée et rattachée à la
+sortie du callback (champ `output` de la requête) : histogramme de latence,
+nombre d'erreurs (statut HTTP >= 500) et octets de la réponse, ainsi que la
+mémoire du processus (RSS et USS). Les compteurs sont propres à chaque
+processus ; avec plusieurs workers gunicorn, chaque worker expose les siens.
+
+Un callback en arrière-plan donne lieu à une requête de lancement puis à des
+interrogations (`?cacheKey=…&job=…`) jusqu'au résultat : aucune n'est mesurée
+isolément. L'heure de lancement de la tâche est notée dans un magasin partagé
+par les workers, et la durée complète de la tâche, jusqu'à l'interrogation
+qui rapporte son résultat, est enregistrée une seule fois avec la taille de ce
+résultat, quel que soit le worker qui la reçoit.
+"""
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+from background_jobs import RESULT_EXPIRE, job_start_store
+from memory_footprint import process_memory
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CALLBACK_PATH = "_dash-update-component"
+
+
+class CallbackMetrics:
+    """Thread-safe per-output latency histograms, error counts and payload sizes"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, output, seconds, payload_bytes, error):
+        with self._lock:
+            series = self._series.setdefault(output, {
+                "buckets": [0] * len(self.buckets),
+                "count": 0,
+                "sum": 0.0,
+                "errors": 0,
+                "payload_bytes": 0,
+            })
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["buckets"][i] += 1
+            series["count"] += 1
+            series["sum"] += seconds
+            series["payload_bytes"] += payload_bytes
+            if error:
+                series["errors"] += 1
+
+    def render(self):
+        """Prometheus text exposition of every recorded output"""
+        with self._lock:
+            snapshot = {output: dict(series, buckets=list(series["buckets"]))
+                        for output, series in self._series.items()}
+
+        lines = [
+            "# HELP dash_callback_latency_seconds Latency of Dash callback requests.",
+            "# TYPE dash_callback_latency_seconds histogram",
+        ]
+        for output, series in sorted(snapshot.items()):
+            label = _escape(output)
+            for bound, count in zip(self.buckets, series["buckets"]):
+                lines.append(f'dash_callback_latency_seconds_bucket{{output="{label}",le="{bound}"}} {count}')
+            lines.append(f'dash_callback_latency_seconds_bucket{{output="{label}",le="+Inf"}} {series["count"]}')
+            lines.append(f'dash_callback_latency_seconds_sum{{output="{label}"}} {series["sum"]}')
+            lines.append(f'dash_callback_latency_seconds_count{{output="{label}"}} {series["count"]}')
+
+        lines += [
+            "# HELP dash_callback_errors_total Dash callback requests that failed.",
+            "# TYPE dash_callback_errors_total counter",
+        ]
+        for output, series in sorted(snapshot.items()):
+            lines.append(f'dash_callback_errors_total{{output="{_escape(output)}"}} {series["errors"]}')
+
+        lines += [
+            "# HELP dash_callback_response_bytes_total Bytes sent in Dash callback responses.",
+            "# TYPE dash_callback_response_bytes_total counter",
+        ]
+        for output, series in sorted(snapshot.items()):
+            lines.append(f'dash_callback_response_bytes_total{{output="{_escape(output)}"}} {series["payload_bytes"]}')
+
+        # Mémoire de ce worker : uss = pages non partagées avec le maître ni les autres workers
+        memory = process_memory()
+        if memory:
+            lines += [
+                "# HELP process_memory_bytes Memory of this worker process by kind (rss, uss).",
+                "# TYPE process_memory_bytes gauge",
+            ]
+            for kind, size in memory.items():
+                lines.append(f'process_memory_bytes{{kind="{kind}",pid="{os.getpid()}"}} {size}')
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    """Escape a Prometheus label value"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _job_key(cache_key, job):
+    return f"{cache_key}:{job}"
+
+
+def init_metrics(server, path="/metrics"):
+    """Instrument the Dash callback route of `server` and serve the metrics on `path`"""
+    metrics = CallbackMetrics()
+    job_starts = job_start_store()
+
+    @server.before_request
+    def start_callback_timer():
+        if request.path.endswith(CALLBACK_PATH):
+            g.callback_started = time.perf_counter()
+            g.callback_started_at = time.time()
+
+    @server.after_request
+    def record_callback(response):
+        started = g.pop("callback_started", None)
+        started_at = g.pop("callback_started_at", None)
+        if started is None:
+            return response
+        body = request.get_json(silent=True) or {}
+        output = str(body.get("output", "unknown"))
+        payload_bytes = response.calculate_content_length() or 0
+        error = response.status_code >= 500
+        cache_key = request.args.get("cacheKey")
+
+        if cache_key is not None:
+            # Interrogation d'une tâche : mesurée une fois, quand elle rapporte le résultat
+            # (ou se termine sans résultat : 204, erreur)
+            if response.status_code == 200 and b'"response"' not in response.get_data():
+                return response  # tâche en cours : progression seulement
+            dispatched_at = job_starts.pop(_job_key(cache_key, request.args.get("job")), None)
+            if dispatched_at is not None:
+                metrics.observe(output, time.time() - dispatched_at, payload_bytes, error)
+            return response
+
+        if response.status_code == 200 and response.get_data().startswith(b'{"cacheKey"'):
+            # Lancement d'une tâche : la durée sera comptée depuis cette requête
+            dispatched = response.get_json(silent=True) or {}
+            if "job" in dispatched:
+                job_starts.set(_job_key(dispatched["cacheKey"], dispatched["job"]), started_at, expire=RESULT_EXPIRE)
+                return response
+
+        metrics.observe(output, time.perf_counter() - started, payload_bytes, error)
+        return response
+
+    def metrics_view():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    server.add_url_rule(path, "metrics", metrics_view)
+    return metrics
@@ -1,49 +1,146 @@
 import pandas as pd
+import io
 import json
 import os
+import argparse
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from crosswalk import load_crosswalk
+from reprojection import read_reprojected_geojson
+from rsqa_cube import append_export, build_cube, cube_dir
+from zoom_variants import ZOOM_BANDS, simplify_geojson, tolerance_for_band, variant_path
 
-def preprocess_arbres_data():
+ARBRES_COLUMNS = ["ARROND_NOM", "Arbre_remarquable"]
+RSQA_FILE = "data/rsqa-indice-qualite-air-station-2022-2024.csv"
+RSQA_DATASET = "data/optimized/rsqa"
+ARBRES_PARQUET = "data/optimized/arbres.parquet"
+# Taille des tranches du CSV des arbres lues et analysées par chaque worker
+CSV_SLICE_BYTES = 64 * 2**20
+
+def _aggregate_arbres_chunk(df):
+    """
+    Count trees and remarkable trees per arrondissement in one block of rows.
+    Returns a DataFrame indexed by ARROND_NOM with partial counts that can be
+    summed across blocks.
+    """
+    noms = df["ARROND_NOM"].str.strip().str.title()
+    remarquables = noms[df["Arbre_remarquable"] == "O"]
+    return pd.DataFrame({
+        "Arbres": noms.value_counts(),
+        "Arbres_remarquables": remarquables.value_counts()
+    }).fillna(0)
+
+def _csv_slices(input_file, slice_bytes):
+    """
+    Byte ranges [start, end) covering the data lines of a CSV, each cut on a
+    line boundary (the inventory has no quoted field spanning several lines).
+    """
+    size = os.path.getsize(input_file)
+    with open(input_file, "rb") as f:
+        f.readline()  # en-tête
+        bounds = [f.tell()]
+        while bounds[-1] + slice_bytes < size:
+            f.seek(bounds[-1] + slice_bytes)
+            f.readline()  # fin de la ligne coupée
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def _sum_counts(partials):
+    """Sum partial counts (None when there is none)"""
+    counts = None
+    for partial in partials:
+        if partial is not None:
+            counts = partial if counts is None else counts.add(partial, fill_value=0)
+    return counts
+
+def _csv_columns(input_file):
+    """Column names of the header line of a CSV"""
+    with open(input_file, "r", encoding="utf-8-sig", newline="") as f:
+        return next(csv.reader([f.readline()]), [])
+
+def _count_csv_slice(task):
+    """Parse one byte range of the CSV (columns named from its header) and count its trees"""
+    input_file, columns, start, end, chunksize = task
+    with open(input_file, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # Tranche lue telle quelle (BytesIO partage les octets) : l'en-tête passe par names
+    reader = pd.read_csv(
+        io.BytesIO(data),
+        header=None,
+        names=columns,
+        usecols=ARBRES_COLUMNS,
+        dtype={"ARROND_NOM": str, "Arbre_remarquable": str},
+        engine="c",
+        on_bad_lines="skip",
+        chunksize=chunksize
+    )
+    return _sum_counts(_aggregate_arbres_chunk(chunk) for chunk in reader)
+
+def _count_parquet_row_group(task):
+    """Read one row group of the Parquet copy and count its trees"""
+    import pyarrow.parquet as pq
+    input_file, row_group = task
+    table = pq.ParquetFile(input_file, memory_map=True).read_row_group(row_group, columns=ARBRES_COLUMNS)
+    return _aggregate_arbres_chunk(table.to_pandas())
+
+def _iter_arbres_counts(input_file, chunksize, workers):
+    """
+    Partial counts of the trees of the input, one per slice: line-aligned byte
+    ranges of the CSV (CSV_SLICE_BYTES each) or row groups of the Parquet copy.
+    Each worker reads and parses its own slice, so only the small partial
+    counts cross process boundaries, and memory stays bounded by the slice size.
+    """
+    if input_file.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        row_groups = pq.ParquetFile(input_file, memory_map=True).num_row_groups
+        count_slice, tasks = _count_parquet_row_group, [(input_file, i) for i in range(row_groups)]
+    else:
+        count_slice = _count_csv_slice
+        columns = _csv_columns(input_file)
+        tasks = [(input_file, columns, start, end, chunksize)
+                 for start, end in _csv_slices(input_file, CSV_SLICE_BYTES)]
+
+    if workers <= 1 or len(tasks) <= 1:
+        yield from map(count_slice, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        yield from executor.map(count_slice, tasks)
+
+def preprocess_arbres_data(chunksize=200_000, workers=None):
     """
     Process the large arbres-publics.csv file to create smaller, pre-aggregated datasets
     for different visualizations.
+
+    The file is cut into slices that `workers` processes (defaults to the number
+    of CPUs) parse and count on their own, in chunks of `chunksize` rows; the
+    partial counts are then merged.
     """
     print("Starting data preprocessing...")
     
-    # Define paths
+    # Define paths (the Parquet copy is preferred when it is up to date)
     input_file = "data/arbres-publics.csv"
+    if _is_fresh(ARBRES_PARQUET, input_file):
+        input_file = ARBRES_PARQUET
     output_dir = "data/optimized"
     
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
-    
-    print(f"Reading large CSV file: {input_file}")
-    # Read only the columns we need
-    df = pd.read_csv(
-        input_file, 
-        usecols=["ARROND_NOM", "Arbre_remarquable"],
-        engine="python", 
-        on_bad_lines="skip"
-    )
-    
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    print(f"Reading large CSV file: {input_file} ({chunksize} rows per chunk, {workers} worker(s))")
+    counts = _sum_counts(_iter_arbres_counts(input_file, chunksize, workers))
+    if counts is None:  # fichier sans aucune ligne
+        counts = pd.DataFrame({"Arbres": [], "Arbres_remarquables": []}, index=pd.Index([], dtype=object))
+
     print("Processing arbres data...")
-    # Clean up data
-    df["ARROND_NOM"] = df["ARROND_NOM"].str.strip().str.title()
-    
-    # Create aggregations
-    # 1. Total trees per arrondissement
-    df_total = df.groupby("ARROND_NOM").size().reset_index(name="Arbres")
-    
-    # 2. Remarkable trees per arrondissement
-    df_remarquables = (
-        df[df["Arbre_remarquable"] == "O"]
-        .groupby("ARROND_NOM")
-        .size()
-        .reset_index(name="Arbres_remarquables")
-    )
-    
-    # 3. Merge for complete dataset
-    df_merged = pd.merge(df_total, df_remarquables, on="ARROND_NOM", how="left")
-    df_merged["Arbres_remarquables"] = df_merged["Arbres_remarquables"].fillna(0).astype(int)
+    # Merge for complete dataset
+    df_merged = counts.sort_index().astype(int).rename_axis("ARROND_NOM").reset_index()
     df_merged["Arbres_non_remarquables"] = df_merged["Arbres"] - df_merged["Arbres_remarquables"]
     
     # Save the aggregated data
@@ -51,12 +148,73 @@ def preprocess_arbres_data():
     print(f"Saving aggregated data to {output_file}")
     df_merged.to_csv(output_file, index=False)
     
-    # Free memory
-    del df
-    
     print("Arbres data preprocessing completed!")
     return output_file
 
+def _is_fresh(artifact, source):
+    """True when `artifact` exists and is newer than `source`"""
+    return os.path.exists(artifact) and os.path.getmtime(artifact) >= os.path.getmtime(source)
+
+def build_columnar_artifacts(chunksize=200_000):
+    """
+    Write Parquet copies of the large CSV inputs so the loaders no longer parse text:
+    - data/optimized/rsqa/: RSQA readings partitioned by year (year=2022/, ...),
+      polluant stored as an Arrow dictionary and stationId dictionary-encoded on disk
+    - data/optimized/arbres.parquet: the columns of the tree inventory used by
+      preprocess_arbres_data, arrondissement names dictionary-encoded
+    Readers can then project columns, push the year filter down to the partitions
+    and memory-map the files.
+    """
+    import shutil
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs("data/optimized", exist_ok=True)
+
+    print(f"Writing {RSQA_DATASET} from {RSQA_FILE}")
+    rsqa = pd.read_csv(RSQA_FILE, parse_dates=["date"], dtype={"polluant": "category"}, engine="c")
+    rsqa["stationId"] = rsqa["stationId"].astype("int32")
+    rsqa["year"] = rsqa["date"].dt.year
+    shutil.rmtree(RSQA_DATASET, ignore_errors=True)
+    pq.write_to_dataset(
+        pa.Table.from_pandas(rsqa, preserve_index=False),
+        root_path=RSQA_DATASET,
+        partition_cols=["year"],
+        use_dictionary=["polluant", "stationId", "adresse"],
+        compression="zstd"
+    )
+
+    print(f"Writing {ARBRES_PARQUET} from data/arbres-publics.csv")
+    schema = pa.schema([
+        ("ARROND_NOM", pa.dictionary(pa.int32(), pa.string())),
+        ("Arbre_remarquable", pa.dictionary(pa.int8(), pa.string())),
+    ])
+    reader = pd.read_csv(
+        "data/arbres-publics.csv",
+        usecols=ARBRES_COLUMNS,
+        dtype={"ARROND_NOM": "category", "Arbre_remarquable": "category"},
+        engine="c",
+        on_bad_lines="skip",
+        chunksize=chunksize
+    )
+    with pq.ParquetWriter(ARBRES_PARQUET, schema, compression="zstd") as writer:
+        for chunk in reader:
+            writer.write_table(pa.Table.from_pandas(chunk[ARBRES_COLUMNS], schema=schema, preserve_index=False))
+
+    print("Columnar artifacts written!")
+    return [RSQA_DATASET, ARBRES_PARQUET]
+
+def build_rsqa_cube():
+    """
+    Build the RSQA station x day cube (data/optimized/rsqa_cube/) from the
+    Parquet copy of the readings if it exists, from the CSV otherwise, plus
+    the days added with --append-rsqa
+    """
+    source = RSQA_DATASET if os.path.isdir(RSQA_DATASET) else RSQA_FILE
+    print(f"Building {cube_dir('data')} from {source}")
+    build_cube(source, "data")
+    return cube_dir("data")
+
 def optimize_geojson():
     """
     Create a simplified version of the quartiers_sociologiques_2014.geojson file
@@ -88,21 +246,59 @@ def optimize_geojson():
     print(f"Simplified GeoJSON saved to {output_file}")
     return output_file
 
+# Couches cartographiques envoyées au navigateur
+GEOJSON_LAYERS = [
+    "data/taux_veg.geojson",
+    "data/territoires_MTL_Clean.geojson",
+    "data/montreal.json",
+    "data/updated_montreal.json",
+]
+
+def simplify_geojson_variants():
+    """
+    Write one simplified copy of each map layer per zoom band, reprojected to
+    EPSG:4326, next to the other optimized files. The loaders pick the variant
+    matching the zoom of the map they build.
+    """
+    print("Building zoom-level GeoJSON variants...")
+    output_files = []
+    for input_file in GEOJSON_LAYERS:
+        if not os.path.exists(input_file):
+            print(f"Skipping missing layer {input_file}")
+            continue
+
+        geojson_data = read_reprojected_geojson(input_file)
+        source_size = os.path.getsize(input_file)
+
+        for band in ZOOM_BANDS:
+            simplified = simplify_geojson(geojson_data, tolerance_for_band(band))
+            output_file = variant_path(input_file, band)
+            with open(output_file, "w", encoding="utf-8") as f:
+                json.dump(simplified, f, separators=(',', ':'))
+            print(f"  {output_file}: {os.path.getsize(output_file) / source_size:.0%} of {input_file}")
+            output_files.append(output_file)
+
+    print("Zoom-level variants saved to data/optimized/")
+    return output_files
+
 def process_jardins_communautaires():
     """
     Process jardins-communautaires.csv to create a smaller aggregated file
-    with counts per arrondissement.
+    with counts per arrondissement. Each garden is assigned to the polygon that
+    contains it, so the counts are keyed by CODEID.
     """
+    from page4.visu_a import aggregate_jardins, assign_jardins
+
     print("Processing jardins communautaires data...")
     
     input_file = "data/jardins-communautaires.csv"
     output_file = "data/optimized/jardins_aggregated.csv"
     
-    # Read the jardins communautaires data
-    df = pd.read_csv(input_file)
+    # Read the jardins communautaires data and locate each garden
+    df = assign_jardins(pd.read_csv(input_file))
     
     # Count jardins per arrondissement
-    jardins_count = df.groupby("arrondissement").size().reset_index(name="jardins_count")
+    jardins_count = aggregate_jardins(df)
     
     # Save the aggregated data
     jardins_count.to_csv(output_file, index=False)
@@ -111,16 +307,49 @@ def process_jardins_communautaires():
     return output_file
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-process the raw datasets into data/optimized/")
+    parser.add_argument("--chunksize", type=int, default=200_000,
+                        help="rows per chunk when streaming arbres-publics.csv")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes used to aggregate the chunks (default: number of CPUs)")
+    parser.add_argument("--append-rsqa", metavar="EXPORT",
+                        help="only add the new days of an RSQA export (CSV) to the station x day cube")
+    parser.add_argument("--rsqa-cube", action="store_true",
+                        help="only build the RSQA station x day cube (run at deploy time)")
+    args = parser.parse_args()
+
+    if args.append_rsqa:
+        added = append_export(args.append_rsqa, "data")
+        print(f"{added} station-days added to {cube_dir('data')}")
+        raise SystemExit(0)
+
+    if args.rsqa_cube:
+        build_rsqa_cube()
+        raise SystemExit(0)
+
     print("Starting data optimization process...")
+
+    # Parquet copies of the RSQA readings and of the tree inventory
+    columnar_files = build_columnar_artifacts(chunksize=args.chunksize)
+
+    # Cube station x jour des indices RSQA (toutes les années)
+    build_rsqa_cube()
     
     # Process arbres data
-    arbres_file = preprocess_arbres_data()
+    arbres_file = preprocess_arbres_data(chunksize=args.chunksize, workers=args.workers)
     
     # Optimize GeoJSON
     geojson_file = optimize_geojson()
+
+    # Simplified variants of the map layers per zoom band
+    variant_files = simplify_geojson_variants()
     
     # Process jardins data
     jardins_file = process_jardins_communautaires()
+
+    # Correspondance des noms d'arrondissements vers les CODEID canoniques
+    crosswalk_table = load_crosswalk()
+    print(f"Crosswalk: {crosswalk_table['CODEID'].notna().sum()}/{len(crosswalk_table)} names matched")
     
     print("All data preprocessing completed!")
     print(f"Generated optimized files in data/optimized/ directory")
\ No newline at end of file
@@ -6,30 +6,23 @@ import plotly.graph_objects as go
 import pandas as pd
 import json
 import geopandas as gpd
+from boundaries import get_boundaries
+from memory_footprint import LEAN_DATA, compact_frame
+
+MAP_ZOOM = 9.8
+# Colonnes utilisées par la carte et le camembert (surfaces en km²)
+SURFACE_COLUMNS = ["Veg_km2", "Min_km2", "Eau_km2", "NonCl_km2", "Veg_Taux"]
 
 # --------------------------------------------------------------------
 # Functions for data loading and figure creation
 # --------------------------------------------------------------------
 def load_page1_data():
     """Load and prepare data for page 1"""
-    import os
-    
-    # Check if we're running from the main directory or page1 directory
-    if os.path.exists("data/taux_veg.geojson"):
-        base_path = "data/"
-    else:
-        base_path = "../data/"
-        
-    # Use the correct path for loading files
-    chemin_geojson = os.path.join(base_path, "taux_veg.geojson")
-    gdf = gpd.read_file(chemin_geojson)
+    # Limites et statistiques de végétalisation, partagées via le registre
+    boundaries = get_boundaries("taux_veg", MAP_ZOOM)
+    geojson_data = boundaries['geojson_data']
 
-    if gdf.crs is None:
-        gdf.set_crs(epsg=2950, inplace=True)
-    gdf_4326 = gdf.to_crs(epsg=4326)
-    geojson_data = json.loads(gdf_4326.to_json())
-    
-    df = gdf_4326.copy()
+    df = pd.DataFrame([dict(props) for props in boundaries['properties']])
     if "CODEID" not in df.columns:
         df["CODEID"] = range(1, len(df)+1)
     if "Veg_km2" not in df.columns:
@@ -51,9 +44,23 @@ def load_page1_data():
     if "NonCl_km2" not in df.columns:
         df["NonCl_km2"] = 0
 
+    # Statistiques par arrondissement pour le callback client du camembert
+    stats = {
+        str(codeid): {"nom": nom, "veg": float(veg), "min": float(mineral), "autres": float(eau + noncl)}
+        for codeid, nom, veg, mineral, eau, noncl in zip(
+            df["CODEID"], df["NOM"], df["Veg_km2"], df["Min_km2"], df["Eau_km2"], df["NonCl_km2"]
+        )
+    }
+
+    if LEAN_DATA:
+        # Les autres propriétés restent dans le registre des limites ; les surfaces
+        # restent en float64, affichées telles quelles dans le survol de la carte
+        df = compact_frame(df[["CODEID", "NOM"] + SURFACE_COLUMNS])
+
     return {
         'df': df,
-        'geojson_data': geojson_data
+        'geojson_data': geojson_data,
+        'stats': {"initial": str(df["CODEID"].iloc[0]), "stats": stats}
     }
 
 def create_page1_figures(data):
@@ -86,7 +93,7 @@ def create_page1_figures(data):
     fig_map.update_layout(
         mapbox_style="carto-positron",
         mapbox_center={"lat":45.55,"lon":-73.65},
-        mapbox_zoom=9.8,
+        mapbox_zoom=MAP_ZOOM,
         margin=dict(l=0,r=0,t=0,b=0),
         height=600,
         dragmode=False,
@@ -1,4 +1,3 @@
-import unicodedata
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output
@@ -6,17 +5,10 @@ import plotly.express as px
 import pandas as pd
 import json
 import os
+from boundaries import get_boundaries
+from crosswalk import codeid_lookup
 
-def clean_string(s: str) -> str:
-    """
-    Convertit la chaîne en minuscules, retire les accents, supprime les espaces,
-    tirets et traits d'union pour uniformiser le nom de quartier.
-    """
-    if not isinstance(s, str):
-        s = str(s)
-    # Retrait des tirets, espaces, etc.
-    s = s.replace('-', '').replace('–', '').replace(' ', '')
-    return s.strip()
+MAP_ZOOM = 9.8
 
 def load_page2_data():
     """Load and prepare data for page 2 from optimized files"""
@@ -25,17 +17,15 @@ def load_page2_data():
     # Check if we're running from the main directory or page2 directory
     if os.path.exists("data/optimized"):
         base_path = "data/optimized/"
-        geojson_base_path = "data/"
     else:
         base_path = "../data/optimized/"
-        geojson_base_path = "../data/"
     
     # Load pre-processed data from optimized directory
     csv_path = os.path.join(base_path, "arbres_aggregated.csv")
     df_aggregated = pd.read_csv(csv_path)
     
-    # Clean names for joining
-    df_aggregated["cleaned_name"] = df_aggregated["ARROND_NOM"].apply(clean_string)
+    # CODEID canonique (entier) de chaque nom, via la table de correspondance
+    df_aggregated["CODEID"] = df_aggregated["ARROND_NOM"].map(codeid_lookup("arbres")).astype("Int64")
     
     # Rename columns for consistency with the rest of the code
     df_grouped = df_aggregated.rename(columns={
@@ -43,43 +33,43 @@ def load_page2_data():
         "Arbres_remarquables": "Nombre d'arbres remarquables"
     })
     
-    # Load and process GeoJSON file - still need this for mapping
-    geojson_path = os.path.join(geojson_base_path, "montreal.json")
-    with open(geojson_path, "r", encoding="utf-8") as f:
-        geojson_data = json.load(f)
+    # Shared arrondissement boundaries - still need this for mapping
+    boundaries = get_boundaries("montreal", MAP_ZOOM)
+    geojson_data = boundaries['geojson_data']
 
-    # Process geojson to add cleaned names
-    for feature in geojson_data["features"]:
-        original = feature["properties"]["NOM"]
-        cleaned = clean_string(original)
-        feature["properties"]["cleaned_name"] = cleaned
-
-    # Create a dataframe with original and cleaned names from geojson
-    geo_rows = []
-    for feat in geojson_data["features"]:
-        original = feat["properties"]["NOM"]
-        cleaned = feat["properties"]["cleaned_name"]
-        geo_rows.append({
-            "original_name": original,
-            "cleaned_name": cleaned
-        })
-    geo_df = pd.DataFrame(geo_rows)
+    # Create a dataframe with the CODEID and names of the boundaries
+    geo_df = pd.DataFrame({
+        "CODEID": pd.array([int(codeid) for codeid in boundaries['ids']], dtype="Int64"),
+        "original_name": [boundaries['names'][codeid] for codeid in boundaries['ids']]
+    })
 
-    # Merge the datasets
+    # Merge the datasets on the integer CODEID
     df_merged = pd.merge(
         geo_df,
-        df_grouped,
+        df_grouped.drop(columns=["ARROND_NOM"]).groupby("CODEID", as_index=False).sum(),
         how="left",
-        on="cleaned_name"
+        on="CODEID"
     )
+    # CODEID en chaîne, comme properties.CODEID du GeoJSON
+    df_merged["CODEID"] = df_merged["CODEID"].astype(str)
 
     # Fill NaN values
     df_merged["Nombre d'arbres"] = df_merged["Nombre d'arbres"].fillna(0)
     df_merged["Nombre d'arbres remarquables"] = df_merged["Nombre d'arbres remarquables"].fillna(0)
 
+    # Statistiques par arrondissement pour le callback client du texte
+    stats = {
+        codeid: {"nom": nom, "arbres": int(arbres), "remarquables": int(remarquables)}
+        for codeid, nom, arbres, remarquables in zip(
+            df_merged["CODEID"], df_merged["original_name"],
+            df_merged["Nombre d'arbres"], df_merged["Nombre d'arbres remarquables"]
+        )
+    }
+
     return {
         'df_merged': df_merged,
-        'geojson_data': geojson_data
+        'geojson_data': geojson_data,
+        'stats': {"stats": stats}
     }
 
 def create_page2_figures(data):
@@ -101,8 +91,8 @@ def create_page2_figures(data):
     fig_map = px.choropleth_mapbox(
         df_merged,
         geojson=geojson_data,
-        locations="cleaned_name",                # doit matcher properties.cleaned_name
-        featureidkey="properties.cleaned_name",
+        locations="CODEID",                # doit matcher properties.CODEID
+        featureidkey="properties.CODEID",
         color="Nombre d'arbres",
         color_continuous_scale=custom_scale,
         range_color=(0, max_val),
@@ -120,7 +110,7 @@ def create_page2_figures(data):
     fig_map.update_layout(
         mapbox_style="carto-positron",
         mapbox_center={"lat":45.55,"lon":-73.65},
-        mapbox_zoom=9.8,
+        mapbox_zoom=MAP_ZOOM,
         margin=dict(l=0,r=0,t=0,b=0),
         height=600,
         dragmode=False,
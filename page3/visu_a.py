@@ -3,10 +3,65 @@ from dash import dcc, html
 from dash.dependencies import Input, Output
 import plotly.express as px
 import pandas as pd
+import numpy as np
+import glob
+import hashlib
 import json
+import os
 import geopandas as gpd
+import shapely
 from shapely.geometry import shape
 from dash_extensions import EventListener
+import plotly.graph_objects as go
+from plotly.colors import sample_colorscale
+from boundaries import get_boundaries
+from memory_footprint import LEAN_DATA, compact_frame
+from reprojection import read_reprojected, source_digest
+from zoom_variants import band_for_zoom, tolerance_for_band
+
+# Zoom des cartes de la page 3 (vue d'ensemble)
+TERRITOIRES_ZOOM = 9
+ESPACES_VERTS_ZOOM = 10
+
+# Échelle de couleur des parcs (km²), comme la carte d'un territoire
+PARK_COLOR_SCALE = "Greens"
+PARK_COLOR_RANGE = (0, 3)
+# Tuiles vectorielles des parcs : une couche de carte n'a qu'une couleur, l'échelle
+# continue est donc approchée par PARK_COLOR_STEPS paliers (0,1 km² chacun)
+PARKS_TILESET = "espaces_verts"
+PARK_COLOR_STEPS = 31
+PARK_CLASS_COLORS = sample_colorscale(PARK_COLOR_SCALE, np.linspace(0, 1, PARK_COLOR_STEPS))
+# Colonnes des parcs gardées en mode économe (LON/LAT : point de survol)
+PARC_COLUMNS = ["OBJECTID", "Nom", "TYPE", "SUPERFICIE", "LON", "LAT"]
+
+def compute_parcs_territoires(objectids, espace_geoms, territory_shapes):
+    """
+    Calcule en une passe la table parc -> territoire (plusieurs-à-plusieurs).
+
+    Les territoires sont indexés dans un STRtree et interrogés pour tous les parcs
+    à la fois ; les intersections et leurs aires sont ensuite calculées de façon
+    vectorisée. Retourne un DataFrame (OBJECTID, CODEID, AREA_RATIO) où AREA_RATIO
+    est la part de la surface du parc située dans le territoire.
+    """
+    codeids = np.array(list(territory_shapes.keys()), dtype=object)
+    territory_geoms = np.array(list(territory_shapes.values()), dtype=object)
+    espace_geoms = np.asarray(espace_geoms, dtype=object)
+
+    tree = shapely.STRtree(territory_geoms)
+    espace_idx, territory_idx = tree.query(espace_geoms, predicate="intersects")
+
+    intersections = shapely.intersection(espace_geoms[espace_idx], territory_geoms[territory_idx])
+    espace_areas = shapely.area(espace_geoms[espace_idx])
+    area_ratio = np.divide(
+        shapely.area(intersections), espace_areas,
+        out=np.zeros(len(espace_idx)), where=espace_areas > 0
+    )
+
+    return pd.DataFrame({
+        "OBJECTID": np.asarray(objectids)[espace_idx],
+        "CODEID": codeids[territory_idx],
+        "AREA_RATIO": area_ratio
+    })
 
 def load_page3_data():
     """Load and prepare data for page 3"""
@@ -21,27 +76,14 @@ def load_page3_data():
         
     # Use the correct path for loading files
     chemin_geojson = os.path.join(base_path, "espace_vert.geojson")
-    gdf = gpd.read_file(chemin_geojson)
-
-    if gdf.crs is None:
-        gdf.set_crs(epsg=2950, inplace=True)
-    espace_vert_gdf_4326 = gdf.to_crs(epsg=4326)
-    espace_vert_geojson_data = json.loads(espace_vert_gdf_4326.to_json())
-
-    chemin_geojson = os.path.join(base_path, "montreal.json")
-    gdf = gpd.read_file(chemin_geojson)
+    # Reprojection EPSG:4326 mise en cache sur disque (refaite si la source change)
+    espace_vert_gdf_4326 = read_reprojected(chemin_geojson)
 
-    if gdf.crs is None:
-        gdf.set_crs(epsg=2950, inplace=True)
-    territoires_MTL_Clean_gdf_4326 = gdf.to_crs(epsg=4326)
-    territoires_MTL_Clean_gdf_4326 = territoires_MTL_Clean_gdf_4326.drop(columns=["DATEMODIF"], errors="ignore")
-    territoires_MTL_Clean_geojson_data = json.loads(territoires_MTL_Clean_gdf_4326.to_json())
-
-    # Ajout d'une étiquette combinant TYPO1 et TYPO2
-    for feature in espace_vert_geojson_data["features"]:
-        typo1 = feature["properties"].get("TYPO1", "Inconnu")
-        typo2 = feature["properties"].get("TYPO2", "Inconnu")
-        feature["properties"]["TYPO_LABEL"] = f"{typo1} | {typo2}"
+    # Limites des territoires, partagées via le registre : formes pleine résolution
+    # pour les calculs, variante simplifiée pour la carte
+    boundaries = get_boundaries("montreal", TERRITOIRES_ZOOM)
+    territoires_MTL_Clean_geojson_data = boundaries['geojson_data']
+    territory_shapes = boundaries['shapes']
 
     # Préparation du DataFrame des espaces verts
     df_espaces_verts = espace_vert_gdf_4326.copy()
@@ -66,97 +108,260 @@ def load_page3_data():
     df_espaces_verts["TYPE"] = df_espaces_verts["TYPE"].astype(str)
     df_espaces_verts["Nom"] = df_espaces_verts["Nom"].astype(str)
 
-    # Mise à jour des données GeoJSON avec le champ TYPE
-    for feature in espace_vert_geojson_data["features"]:
-        objectid = feature["properties"].get("OBJECTID")
-        if objectid is not None:
-            matching_rows = df_espaces_verts.loc[df_espaces_verts["OBJECTID"] == objectid, "TYPE"]
-            type_value = matching_rows.values[0] if not matching_rows.empty else "Type inconnu"
-        else:
-            type_value = "Type inconnu"
-        feature["properties"]["TYPE"] = type_value
+    # Géométries des parcs : un seul exemplaire, aligné sur les lignes de la table,
+    # pour l'attribution aux territoires et les tuiles ; un point de survol par parc
+    espace_geometries = np.asarray(espace_vert_gdf_4326.geometry.values, dtype=object)
+    hover_points = shapely.point_on_surface(espace_geometries)
+    df_espaces_verts["LON"] = shapely.get_x(hover_points)
+    df_espaces_verts["LAT"] = shapely.get_y(hover_points)
 
     # Préparation du DataFrame des territoires
-    df_territoires = territoires_MTL_Clean_gdf_4326.copy()
-    if "CODEID" not in df_territoires.columns:
-        df_territoires["CODEID"] = range(1, len(df_territoires) + 1)
+    df_territoires = pd.DataFrame([dict(props) for props in boundaries['properties']])
+    df_territoires = df_territoires.drop(columns=["DATEMODIF"], errors="ignore")
     if "NOM" not in df_territoires.columns:
         df_territoires["NOM"] = "Nom inconnu"
 
-    # Convert CODEID to string to match GeoJSON format
-    df_territoires["CODEID"] = df_territoires["CODEID"].astype(str)
-
-    # Calcul des intersections entre espaces verts et territoires
-    territory_superficie = {str(territory["properties"]["CODEID"]): 0 for territory in territoires_MTL_Clean_geojson_data["features"]}
-    territory_shapes = {str(territory["properties"]["CODEID"]): shape(territory["geometry"]) for territory in territoires_MTL_Clean_geojson_data["features"]}
-
-    for espace in espace_vert_geojson_data["features"]:
-        espace_shape = shape(espace["geometry"])
-        espace_superficie = espace["properties"].get("SUPERFICIE", 0)
-        for codeid, territory_shape in territory_shapes.items():
-            if espace_shape.intersects(territory_shape):
-                intersection = espace_shape.intersection(territory_shape)
-                intersection_area_ratio = intersection.area / espace_shape.area
-                territory_superficie[codeid] += float(espace_superficie) * intersection_area_ratio
+    # CODEID canonique (chaîne) du registre, comme dans le GeoJSON
+    df_territoires["CODEID"] = list(boundaries['ids'])
 
-    df_territoires["SUPERFICIE"] = df_territoires["CODEID"].map(territory_superficie)
-
-    # Calcul du nombre de parcs par territoire
-    territory_parc_count = {str(territory["properties"]["CODEID"]): 0 for territory in territoires_MTL_Clean_geojson_data["features"]}
+    # Table parc -> territoire (réutilisée d'un démarrage à l'autre), nommée d'après
+    # le condensé du contenu des sources comme les couches reprojetées
+    sources = [os.path.join(base_path, "espace_vert.geojson"), os.path.join(base_path, "montreal.json")]
+    digest = hashlib.sha256("".join(source_digest(p) for p in sources).encode("utf-8")).hexdigest()[:16]
+    table_path = os.path.join(base_path, "optimized", f"parcs_territoires-{digest}.csv")
+    if os.path.exists(table_path):
+        df_parcs_territoires = pd.read_csv(table_path, dtype={"CODEID": str})
+    else:
+        df_parcs_territoires = compute_parcs_territoires(
+            df_espaces_verts["OBJECTID"].values,
+            espace_geometries,
+            territory_shapes
+        )
+        os.makedirs(os.path.dirname(table_path), exist_ok=True)
+        # Écriture atomique : un autre worker (ou le maître) ne lit jamais une table partielle
+        tmp_path = f"{table_path}.{os.getpid()}.tmp"
+        df_parcs_territoires.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, table_path)
+        for stale in glob.glob(os.path.join(os.path.dirname(table_path), "parcs_territoires*.csv")):
+            if stale != table_path:
+                os.remove(stale)
 
-    for espace in espace_vert_geojson_data["features"]:
-        espace_shape = shape(espace["geometry"])
-        for codeid, territory_shape in territory_shapes.items():
-            if espace_shape.intersects(territory_shape):
-                territory_parc_count[codeid] += 1
+    # Superficie (au prorata de la surface intersectée) et nombre de parcs par territoire
+    parc_superficie = df_parcs_territoires["OBJECTID"].map(
+        dict(zip(df_espaces_verts["OBJECTID"], df_espaces_verts["SUPERFICIE"]))
+    ).fillna(0)
+    overlay = df_parcs_territoires.assign(SUPERFICIE=parc_superficie * df_parcs_territoires["AREA_RATIO"])
+    territory_superficie = overlay.groupby("CODEID")["SUPERFICIE"].sum()
+    territory_parc_count = overlay.groupby("CODEID").size()
 
-    df_territoires["PARC_COUNT"] = df_territoires["CODEID"].map(territory_parc_count)
+    df_territoires["SUPERFICIE"] = df_territoires["CODEID"].map(territory_superficie).fillna(0)
+    df_territoires["PARC_COUNT"] = df_territoires["CODEID"].map(territory_parc_count).fillna(0).astype(int)
 
     # Conversion des unités en km²
     df_territoires["SUPERFICIE"] = (df_territoires["SUPERFICIE"].astype(float) / 100).round(3)
     df_espaces_verts["SUPERFICIE"] = (df_espaces_verts["SUPERFICIE"].astype(float) / 100).round(3)
-    
+
+    if LEAN_DATA:
+        # Table sans géométrie ni colonnes inutilisées : les géométries restent dans espace_geometries
+        df_espaces_verts = compact_frame(
+            pd.DataFrame(df_espaces_verts[PARC_COLUMNS]), float32_columns=("SUPERFICIE", "LON", "LAT")
+        )
+        df_parcs_territoires = compact_frame(df_parcs_territoires, float32_columns=("AREA_RATIO",))
+    del espace_vert_gdf_4326
+
+    territory_views = build_territory_views(
+        df_territoires, df_espaces_verts, df_parcs_territoires, territory_shapes
+    )
+
     return {
         'df_espaces_verts': df_espaces_verts,
+        'espace_geometries': espace_geometries,
         'df_territoires': df_territoires,
-        'espace_vert_geojson_data': espace_vert_geojson_data,
+        'df_parcs_territoires': df_parcs_territoires,
         'territoires_MTL_Clean_geojson_data': territoires_MTL_Clean_geojson_data,
-        'territory_shapes': territory_shapes
+        'territory_shapes': territory_shapes,
+        'territory_views': territory_views
+    }
+
+def territory_zoom(territory_shape, max_zoom=12, min_zoom=9):
+    """Niveau de zoom pour qu'un territoire tienne dans la carte (~600 px de large)"""
+    minx, miny, maxx, maxy = territory_shape.bounds
+    lat = (miny + maxy) / 2
+    span = max(maxx - minx, (maxy - miny) / np.cos(np.radians(lat)), 1e-6)
+    zoom = np.log2(360 * 600 / (256 * span))
+    return float(np.clip(zoom, min_zoom, max_zoom))
+
+def build_territory_views(df_territoires, df_espaces_verts, df_parcs_territoires, territory_shapes):
+    """
+    Prépare, pour chaque CODEID, tout ce qu'un clic sur le territoire affiche :
+    les positions des parcs du territoire dans df_espaces_verts (`rows`, plutôt
+    qu'une copie des lignes), le centre et le zoom de la carte, ainsi que le nom,
+    le nombre de parcs et la superficie. Les polygones des parcs du territoire
+    sont extraits d'espace_geometries au moment du clic (`territory_geojson`).
+    """
+    objectids_by_territory = df_parcs_territoires.groupby("CODEID", observed=True)["OBJECTID"].apply(list).to_dict()
+    objectids = df_espaces_verts["OBJECTID"]
+
+    territory_views = {}
+    for territoire in df_territoires.itertuples(index=False):
+        codeid = territoire.CODEID
+        territory_shape = territory_shapes.get(codeid)
+        if territory_shape is None:
+            continue
+        territory_objectids = objectids_by_territory.get(codeid, [])
+        centroid = territory_shape.centroid
+        zoom = territory_zoom(territory_shape)
+        territory_views[codeid] = {
+            'name': territoire.NOM,
+            'parc_count': territoire.PARC_COUNT,
+            'superficie': territoire.SUPERFICIE,
+            'center': {"lat": centroid.y, "lon": centroid.x},
+            'zoom': zoom,
+            'rows': np.flatnonzero(objectids.isin(territory_objectids)).astype(np.int32)
+        }
+    return territory_views
+
+def park_color_classes(superficie):
+    """Palier de PARK_CLASS_COLORS le plus proche de chaque superficie (km²), bornée à PARK_COLOR_RANGE"""
+    low, high = PARK_COLOR_RANGE
+    position = np.clip((np.asarray(superficie, dtype=float) - low) / (high - low), 0, 1)
+    return np.rint(position * (PARK_COLOR_STEPS - 1)).astype(int)
+
+def park_tile_layers(data):
+    """
+    Couches des tuiles vectorielles de la page 3 : les parcs, répartis en une
+    couche par palier de couleur (la couleur d'une couche de carte est
+    unique), et les limites des arrondissements.
+    """
+    df_espaces_verts = data['df_espaces_verts']
+    classes = park_color_classes(df_espaces_verts["SUPERFICIE"].to_numpy())
+    properties = df_espaces_verts[["OBJECTID", "Nom"]].to_dict(orient="records")
+    geometries = data['espace_geometries']
+
+    layers = {}
+    for class_index in range(len(PARK_CLASS_COLORS)):
+        in_class = np.flatnonzero(classes == class_index)
+        layers[f"espaces_verts_{class_index}"] = (geometries[in_class], [properties[i] for i in in_class])
+
+    territoires = data['df_territoires']
+    layers["arrondissements"] = (
+        [data['territory_shapes'][codeid] for codeid in territoires["CODEID"]],
+        territoires[["CODEID", "NOM"]].to_dict(orient="records")
+    )
+    return layers
+
+def tile_map_layers(tiles_url):
+    """Couches mapbox affichant les tuiles des parcs et des arrondissements (`tiles_url` : modèle XYZ du tileset)"""
+    source = [tiles_url]
+    layers = [
+        {
+            "sourcetype": "vector",
+            "source": source,
+            "sourcelayer": f"espaces_verts_{class_index}",
+            "type": "fill",
+            "color": color,
+            "opacity": 0.8,
+            "below": "traces",
+        }
+        for class_index, color in enumerate(PARK_CLASS_COLORS)
+    ]
+    layers.append({
+        "sourcetype": "vector",
+        "source": source,
+        "sourcelayer": "arrondissements",
+        "type": "line",
+        "color": "black",
+        "line": {"width": 0.5},
+        "below": "traces",
+    })
+    return layers
+
+def territory_geojson(data, rows, zoom):
+    """
+    FeatureCollection des parcs aux positions `rows` de df_espaces_verts,
+    simplifiés au demi-pixel du zoom de la carte (propriété OBJECTID)
+    """
+    geometries = shapely.simplify(
+        data['espace_geometries'][rows], tolerance_for_band(band_for_zoom(zoom)), preserve_topology=True
+    )
+    objectids = data['df_espaces_verts']["OBJECTID"].to_numpy()[rows]
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "properties": {"OBJECTID": int(objectid)}, "geometry": json.loads(geometry)}
+            for objectid, geometry in zip(objectids, shapely.to_geojson(geometries))
+        ],
     }
 
-def carte_espaces_verts(df_espaces_verts, _zoom, _center, _geojson_data):
-    """Helper function to create green spaces map"""
-    map = px.choropleth_mapbox(
-        df_espaces_verts,
-        geojson=_geojson_data,
-        locations="OBJECTID",
-        featureidkey="properties.OBJECTID",
-        color="SUPERFICIE",
-        hover_name="Nom",
-        hover_data={"OBJECTID": False, "TYPE": True, "SUPERFICIE": True},
-        labels={"SUPERFICIE": "Superficie (km²)", "TYPE": "Type d'espace vert"},
+def carte_espaces_verts(df_espaces_verts, _zoom, _center, _geojson_data=None):
+    """Helper function to create green spaces map
+
+    Avec `_geojson_data` (les parcs d'un territoire), la figure contient les
+    polygones, colorés par superficie et survolables. Sans, c'est la vue
+    d'ensemble de la ville : les polygones sont affichés par les couches de
+    tuiles (`tile_map_layers`, ajoutées au moment de la requête) et la figure
+    ne porte qu'un point par parc pour le survol (LON, LAT).
+    """
+    if _geojson_data is not None:
+        # float64 arrondi : pas de décimales parasites de float32 dans le survol
+        df_espaces_verts = pd.DataFrame({
+            "OBJECTID": df_espaces_verts["OBJECTID"].to_numpy(),
+            "Nom": df_espaces_verts["Nom"].to_numpy(dtype=object),
+            "TYPE": df_espaces_verts["TYPE"].to_numpy(dtype=object),
+            "SUPERFICIE": np.round(df_espaces_verts["SUPERFICIE"].to_numpy(dtype=float), 3),
+        })
+        map = px.choropleth_mapbox(
+            df_espaces_verts,
+            geojson=_geojson_data,
+            locations="OBJECTID",
+            featureidkey="properties.OBJECTID",
+            color="SUPERFICIE",
+            hover_name="Nom",
+            hover_data={"OBJECTID": False, "TYPE": True, "SUPERFICIE": True},
+            labels={"SUPERFICIE": "Superficie (km²)", "TYPE": "Type d'espace vert"},
+            mapbox_style="carto-positron",
+            center=_center,
+            zoom=_zoom,
+            color_continuous_scale=PARK_COLOR_SCALE,
+            range_color=PARK_COLOR_RANGE,
+        )
+        map.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0}, hovermode="closest", coloraxis_showscale=False)
+        return map
+
+    map = go.Figure(go.Scattermapbox(
+        lon=df_espaces_verts["LON"].to_numpy(),
+        lat=df_espaces_verts["LAT"].to_numpy(),
+        mode="markers",
+        marker=dict(size=5, color="darkgreen", opacity=0.6),
+        customdata=np.column_stack([
+            df_espaces_verts["Nom"].to_numpy(dtype=object),
+            df_espaces_verts["TYPE"].to_numpy(dtype=object),
+            np.round(df_espaces_verts["SUPERFICIE"].to_numpy(dtype=float), 3).astype(object),
+        ]),
+        hovertemplate="<b>%{customdata[0]}</b><br>Type d'espace vert=%{customdata[1]}"
+                      "<br>Superficie (km²)=%{customdata[2]}<extra></extra>",
+        showlegend=False
+    ))
+    map.update_layout(
         mapbox_style="carto-positron",
-        center=_center,
-        zoom=_zoom,
-        color_continuous_scale="Greens",
-        range_color=(0, 3),
+        mapbox_center=_center,
+        mapbox_zoom=_zoom,
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        hovermode="closest"
     )
-    map.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0}, hovermode="closest", coloraxis_showscale=False)
     return map
 
 def create_page3_figures(data):
     """Create figures for page 3"""
     df_espaces_verts = data['df_espaces_verts']
     df_territoires = data['df_territoires']
-    espace_vert_geojson_data = data['espace_vert_geojson_data']
     territoires_MTL_Clean_geojson_data = data['territoires_MTL_Clean_geojson_data']
     
     # Création de la carte des espaces verts
     espace_verts_map = carte_espaces_verts(
         df_espaces_verts, 
-        10, 
-        {"lat": 45.55, "lon": -73.75}, 
-        espace_vert_geojson_data
+        ESPACES_VERTS_ZOOM, 
+        {"lat": 45.55, "lon": -73.75}
     )
     
     # Créer une copie du dataframe pour ne pas modifier l'original
@@ -193,7 +398,7 @@ def create_page3_figures(data):
         },
         mapbox_style="carto-positron",
         center={"lat": 45.55, "lon": -73.75},
-        zoom=9,
+        zoom=TERRITOIRES_ZOOM,
         color_continuous_scale="Greens",
         range_color=(0, 10),
     )
@@ -4,6 +4,25 @@ import plotly.express as px
 import plotly.graph_objects as go
 import json
 import geopandas as gpd
+import os
+from boundaries import get_boundaries, locate_points
+
+MAP_ZOOM = 9.9
+# Limites utilisées pour la carte et l'attribution des jardins
+JARDINS_BOUNDARIES = "updated_montreal"
+
+def assign_jardins(df):
+    """Ajoute à chaque jardin le CODEID du polygone qui le contient (None hors limites)"""
+    df = df.copy()
+    df["CODEID"] = locate_points(JARDINS_BOUNDARIES, df["longitude"], df["latitude"])
+    return df
+
+def aggregate_jardins(df):
+    """Nombre de jardins par CODEID, avec le nom de l'arrondissement"""
+    names = get_boundaries("montreal", MAP_ZOOM)['names']
+    counts = df["CODEID"].dropna().value_counts().rename_axis("CODEID").reset_index(name="jardins_count")
+    counts.insert(1, "arrondissement", counts["CODEID"].map(names))
+    return counts
 
 def load_page4_data():
     """Load and prepare data for page 4"""
@@ -17,14 +36,30 @@ def load_page4_data():
         
     # Use the correct path for loading files
     csv_jardins_path = os.path.join(base_path, "jardins-communautaires.csv")
-    df = pd.read_csv(csv_jardins_path)
+    df = assign_jardins(pd.read_csv(csv_jardins_path))
+
+    # Table des comptes produite par optimize_data.py, recalculée si elle est périmée
+    counts_path = os.path.join(base_path, "optimized", "jardins_aggregated.csv")
+    sources = [csv_jardins_path, os.path.join(base_path, "updated_montreal.json")]
+    df_counts = None
+    if os.path.exists(counts_path) and os.path.getmtime(counts_path) >= max(os.path.getmtime(p) for p in sources):
+        df_counts = pd.read_csv(counts_path, dtype={"CODEID": str})
+    if df_counts is None or "CODEID" not in df_counts.columns:  # ancien format, par nom
+        df_counts = aggregate_jardins(df)
+
+    # Limites partagées via le registre
+    boundaries = get_boundaries(JARDINS_BOUNDARIES, MAP_ZOOM)
+    geojson_jardins_data = boundaries['geojson_data']
+
+    # Réponse d'un clic (marqueur ou polygone) : CODEID -> nom et nombre de jardins
+    names = get_boundaries("montreal", MAP_ZOOM)['names']
+    jardins_counts = {codeid: {"nom": names.get(codeid, codeid), "jardins": 0} for codeid in boundaries['ids']}
+    for codeid, nom, count in zip(df_counts["CODEID"], df_counts["arrondissement"], df_counts["jardins_count"]):
+        jardins_counts[codeid] = {"nom": nom, "jardins": int(count)}
 
-    geojson_jardins_path = os.path.join(base_path, "updated_montreal.json")
-    with open(geojson_jardins_path, "r", encoding="utf-8") as f:
-        geojson_jardins_data = json.load(f)
-    
     return {
         'df': df,
+        'jardins_counts': jardins_counts,
         'geojson_jardins_data': geojson_jardins_data
     }
 
@@ -36,18 +71,17 @@ def create_page4_figures(data):
     # Create base figure
     fig = go.Figure()
 
-    # Add choropleth layer first
+    # Add choropleth layer first (un clic renvoie le CODEID du polygone dans location)
     fig.add_trace(go.Choroplethmapbox(
         geojson=geojson_jardins_data,
-        locations=[feature["properties"]["NOM"] for feature in geojson_jardins_data["features"]],
+        locations=[feature["properties"]["CODEID"] for feature in geojson_jardins_data["features"]],
         z=[1] * len(geojson_jardins_data["features"]),  # Dummy values
-        featureidkey="properties.NOM",
+        featureidkey="properties.CODEID",
         colorscale=[[0, "rgb(128,150,128)"], [1, "rgb(128,150,128)"]],  # Solid color
         showscale=False,
         marker_line_width=1,
         marker_line_color="white",
         hoverinfo="none",
-        customdata=["arrondissement"],  # Explicitly include arrondissements
     ))
 
     # Add scatter markers on top
@@ -62,7 +96,7 @@ def create_page4_figures(data):
         ),
         hovertext=df["nom"],  # Main title
         hoverinfo="text",
-        customdata=df[["arrondissement", "adresse"]],
+        customdata=df[["arrondissement", "adresse", "CODEID"]],
         hovertemplate=(
             "<b>%{hovertext}</b><br>" +
             " %{customdata[0]}<br>" +
@@ -73,7 +107,7 @@ def create_page4_figures(data):
     fig.update_layout(
         mapbox_style="carto-positron",
         mapbox_center={"lat":45.55,"lon":-73.65},
-        mapbox_zoom=9.9,
+        mapbox_zoom=MAP_ZOOM,
         margin=dict(l=0,r=0,t=0,b=0),
         height=600,
         dragmode=False
@@ -131,12 +165,12 @@ if __name__ == "__main__":
             return "cliquez sur un point pour voir le nombre de jardins dans l'arrondissement."
         
         try:
-            df = data['df']
-            arrondissement = clickData["points"][0]["customdata"][0]  # arrondissement is first in customdata
-            jardin_count = len(df[df["arrondissement"] == arrondissement])
+            point = clickData["points"][0]
+            codeid = point.get("location") or point["customdata"][2]  # polygone ou marqueur
+            row = data['jardins_counts'][codeid]
             return html.Div([
-                html.H3(f"Arrondissement: {arrondissement}"),
-                html.P(f"Nombre de jardins communautaires: {jardin_count}"),
+                html.H3(f"Arrondissement: {row['nom']}"),
+                html.P(f"Nombre de jardins communautaires: {row['jardins']}"),
                 html.P("Cliquez sur un jardin pour voir ses détails.")
             ])
         except (KeyError, IndexError):
@@ -4,14 +4,19 @@ from dash import dcc, html
 from dash.dependencies import Input, Output
 import plotly.express as px
 import pandas as pd
+import numpy as np
 import json
 import copy
-import logging
-logging.basicConfig(level=logging.DEBUG)
 import geopandas as gpd
 import plotly.graph_objects as go
 from shapely.geometry import shape
 from dash_extensions import EventListener
+from boundaries import get_boundaries
+from rsqa_cube import cube_years, load_cube
+
+MAP_ZOOM = 9.9
+# Année affichée au chargement (la plus récente du cube si elle n'y est pas)
+DEFAULT_YEAR = 2024
 
 # Function for data loading
 POLLUTANT_FULL_NAMES = {
@@ -20,6 +25,88 @@ POLLUTANT_FULL_NAMES = {
     "PM": "Particules fines",
     "SO2": "Dioxyde de soufre"
 }
+# Catégories de qualité de l'air (codes 0, 1, 2) et leurs couleurs
+QUALITY_CATEGORIES = np.array(["Bon", "Acceptable", "Mauvais"], dtype=object)
+QUALITY_COLORS = np.array(["green", "orange", "red"], dtype=object)
+# Bornes supérieures (incluses) des catégories Bon et Acceptable
+QUALITY_BINS = np.array([25, 50])
+
+def build_station_series(df):
+    """
+    Découpe les mesures journalières en séries par station : pour chaque nom de
+    station, des tableaux NumPy contigus triés par date (dates, valeurs, codes de
+    catégorie, codes de polluant). Les libellés des polluants sont retournés à part.
+    """
+    df_sorted = df.sort_values(["nom", "date"], kind="stable")
+    dates = df_sorted["date"].to_numpy()
+    values = df_sorted["valeur"].to_numpy()
+    quality_codes = pd.Categorical(df_sorted["quality_cat"], categories=QUALITY_CATEGORIES).codes
+    polluants = pd.Categorical(df_sorted["polluant"])
+    polluant_codes = polluants.codes
+
+    station_series = {}
+    for nom, positions in df_sorted.groupby("nom", sort=False, observed=True).indices.items():
+        rows = slice(positions[0], positions[-1] + 1)
+        station_series[nom] = {
+            'dates': np.ascontiguousarray(dates[rows]),
+            'values': np.ascontiguousarray(values[rows]),
+            'quality_codes': np.ascontiguousarray(quality_codes[rows]),
+            'polluant_codes': np.ascontiguousarray(polluant_codes[rows]),
+        }
+    return station_series, np.asarray(polluants.categories, dtype=object)
+
+def quality_codes(values):
+    """Code de catégorie de chaque indice : 0 Bon (<= 25), 1 Acceptable (<= 50), 2 Mauvais"""
+    return np.digitize(values, QUALITY_BINS, right=True).astype(np.int8)
+
+def build_year_view(cube, station_names, year):
+    """
+    Vue d'une année du cube RSQA : les maxima journaliers de l'année (df), une
+    ligne par station (df_stats : coordonnées, polluants mesurés, nombre de jours
+    par catégorie) et les séries par station pour la courbe.
+    """
+    daily = cube["daily"]
+    df = daily[(daily["date"].dt.year == year).to_numpy()].reset_index(drop=True)
+    df["nom"] = df["stationId"].map(station_names).astype("category")
+
+    # maximum catégorisation et comptage
+    codes = quality_codes(df["valeur"].to_numpy())
+    df["quality_cat"] = pd.Categorical.from_codes(codes, categories=QUALITY_CATEGORIES)
+
+    station_ids = np.unique(df["stationId"].to_numpy())
+    station_codes = np.searchsorted(station_ids, df["stationId"].to_numpy())
+    counts = np.zeros((len(station_ids), len(QUALITY_CATEGORIES)), dtype=np.int32)
+    np.add.at(counts, (station_codes, codes), 1)
+
+    # get a list of all the polluants mesured in each station (matrice de présence)
+    polluants = cube["polluants"][(cube["polluants"]["year"] == year).to_numpy()]
+    polluant_categories = np.asarray(polluants["polluant"].cat.categories, dtype=object)
+    rows = np.searchsorted(station_ids, polluants["stationId"].to_numpy())
+    measured = (rows < len(station_ids)) & (station_ids[np.minimum(rows, len(station_ids) - 1)] == polluants["stationId"].to_numpy())
+    presence = np.zeros((len(station_ids), len(polluant_categories)), dtype=bool)
+    presence[rows[measured], polluants["polluant"].cat.codes.to_numpy()[measured]] = True
+
+    # ajoute coordonnées + adresse
+    stations = cube["stations"].set_index("stationId").reindex(station_ids)
+    df_stats = pd.DataFrame({
+        "stationId": station_ids,
+        "nom": station_names.reindex(station_ids).to_numpy(dtype=object),
+        "adresse": stations["adresse"].to_numpy(dtype=object),
+        "latitude": stations["latitude"].to_numpy(),
+        "longitude": stations["longitude"].to_numpy(),
+        "polluants_list": [", ".join(polluant_categories[row]) for row in presence],
+    })
+    for idx, cat in enumerate(QUALITY_CATEGORIES):
+        df_stats[cat] = counts[:, idx]
+
+    station_series, polluant_labels = build_station_series(df)
+    return {
+        'df': df,
+        'df_stats': df_stats,
+        'station_series': station_series,
+        'polluant_labels': polluant_labels,
+    }
+
 def load_page5_data():
     import os
     if os.path.exists("data/rsqa-indice-qualite-air-station-2022-2024.csv"):
@@ -27,6 +114,8 @@ def load_page5_data():
     else:
         base_path = "../data/"
     csv_path = os.path.join(base_path, "rsqa-indice-qualite-air-station-2022-2024.csv")
+    # Cube station x jour de toutes les années, construit par optimize_data.py (--rsqa-cube)
+    cube = load_cube(base_path, csv_path)
     
     base_path="data/"
     stations_filename = 'liste-des-stations-rsqa.csv'
@@ -37,49 +126,29 @@ def load_page5_data():
         base_path = "../data/"
         stations_filepath=os.path.join(base_path,stations_filename)
             
-    df_stations_info = pd.read_csv(stations_filepath)
-    df = pd.read_csv(csv_path, parse_dates=["date"])
+    df_stations_info = pd.read_csv(stations_filepath, usecols=["numero_station", "nom"])
     
-    # keep only data from 2024
-    df["date"] = pd.to_datetime(df["date"])
-    df = df[df["date"].dt.year == 2024].copy()
-    #print(f'liste de tous les polluants mesurés {df['polluant'].unique()}')
-    # get a list of all the polluants mesured in each station
-    polluant_dict = df.groupby("stationId")["polluant"].unique().apply(list).to_dict()
-    df["polluants_list"] = df["stationId"].map(polluant_dict).apply(lambda x: x if isinstance(x, list) else [])
-    df["polluants_list"] = df["polluants_list"].apply(lambda x: ', '.join(x))
-    # get only one value per day, the one with the highest value
-    df = df.loc[df.groupby(["stationId", "date"])["valeur"].idxmax()]
-    
-    geojson_station_path = os.path.join(base_path, "updated_montreal.json")
-    with open(geojson_station_path, "r", encoding="utf-8") as f:
-        geojson_station_path_data = json.load(f)
-        
-    df = df.merge(  df_stations_info[["numero_station", "nom"]], 
-                    left_on="stationId", right_on="numero_station", 
-                    how="left").drop(columns=["numero_station"])
-    
-    df["nom"] = df["nom"].str.replace("Saint", "St")
-    df.loc[df["nom"] == "Hochelaga-Maisonneuve", "nom"] = "Maisonneuve"
-    
-    
-    # maximum catégorisation et comptage
-    def cat(v):
-        return "Bon" if v<=25 else "Acceptable" if v<=50 else "Mauvais"
-    df["quality_cat"] = df["valeur"].map(cat)
-    
-    cnt = ( df.pivot_table(index="stationId", columns="quality_cat", aggfunc="size", fill_value=0).reset_index())
-    
-    # ajoute coordonnées + adresse
-    coords = (
-        df[["stationId","nom","adresse","latitude","longitude","polluants_list"]]
-        .drop_duplicates("stationId")
-    )
-    df_stats =  coords.merge(cnt, on="stationId", how="left").fillna(0)
+    # Limites partagées via le registre
+    geojson_station_path_data = get_boundaries("updated_montreal", MAP_ZOOM)['geojson_data']
+
+    # Noms courts des stations, appliqués à la liste des stations plutôt qu'à chaque ligne
+    station_names = df_stations_info.set_index("numero_station")["nom"].str.replace("Saint", "St")
+    station_names = station_names.replace({"Hochelaga-Maisonneuve": "Maisonneuve"})
+
+    # Une vue par année ; la plus récente est affichée par défaut
+    years = cube_years(cube)
+    year_views = {year: build_year_view(cube, station_names, year) for year in years}
+    default_year = DEFAULT_YEAR if DEFAULT_YEAR in year_views else years[-1]
+    default_view = year_views[default_year]
 
     return {
-        'df': df,
-        'df_stats':df_stats,
+        'df': default_view['df'],
+        'df_stats': default_view['df_stats'],
+        'station_series': default_view['station_series'],
+        'polluant_labels': default_view['polluant_labels'],
+        'years': years,
+        'default_year': default_year,
+        'year_views': year_views,
         'geojson_station_data': geojson_station_path_data
     }
 
@@ -100,8 +169,7 @@ def create_base_map(geojson, stats_df):
         hoverinfo="skip"
     ))
 
-    # 2) points pour chaque station, on stocke le triplet [id, bon, acc, mau] dans customdata
-    stats_df["custom"] = stats_df[["stationId","Bon","Acceptable","Mauvais","nom","polluants_list"]].values.tolist()
+    # 2) points pour chaque station, avec [nom, bon, acc, mau, polluants] dans customdata
     fig.add_trace(go.Scattermapbox(
         lat=stats_df["latitude"],
         lon=stats_df["longitude"],
@@ -115,7 +183,7 @@ def create_base_map(geojson, stats_df):
     fig.update_layout(
         mapbox_style="carto-positron",
         mapbox_center={"lat":45.55,"lon":-73.65},
-        mapbox_zoom=9.9,
+        mapbox_zoom=MAP_ZOOM,
         margin=dict(l=0,r=0,t=0,b=0),
         height=600,
         dragmode=False
@@ -145,38 +213,41 @@ def create_base_map(geojson, stats_df):
 
     return fig
 
-def add_bars(   fig, stats_df, station_id,
-                scale=0.00009,   # hauteur = jours * scale
-                dx=0.01,         # espacement horizontal ≃ 1 km
-                zoom=10,
-                min_height=0.001,  # minimum height for visibility
-                ):
+def build_bar_traces(stats_df,
+                     scale=0.00009,   # hauteur = jours * scale
+                     dx=0.01,         # espacement horizontal ≃ 1 km
+                     zoom=10,
+                     min_height=0.001,  # minimum height for visibility
+                     ):
     """
-    Dessine trois segments verticaux côte à côte pour Bon / Acceptable / Mauvais.
+    Dessine, pour toutes les stations, trois segments verticaux côte à côte pour
+    Bon / Acceptable / Mauvais. Une seule trace par catégorie : les segments des
+    stations sont séparés par des NaN.
     """
-    row = stats_df.loc[stats_df["stationId"] == station_id].iloc[0]
-    lon0, lat0 = row["longitude"], row["latitude"]
     colors = {"Bon": "green", "Acceptable": "orange", "Mauvais": "red"}
     cats   = ["Bon", "Acceptable", "Mauvais"]
-    
+    lon0 = stats_df["longitude"].to_numpy(dtype=float)
+    lat0 = stats_df["latitude"].to_numpy(dtype=float)
+
+    traces = []
     for idx, cat in enumerate(cats):
-        jours = int(row.get(cat, 0))
-        
-        # Calculate bar height - ensure minimum visibility even with very small values
-        if jours > 0:
-            bar_height = max(jours * scale, min_height)
-        else:
+        jours = stats_df[cat].to_numpy(dtype=int) if cat in stats_df else np.zeros(len(stats_df), dtype=int)
+        visible = jours > 0
+        jours = jours[visible]
+        if not len(jours):
             continue
-            
-        # calcul des positions
-        lon_shift = lon0 + (idx - 1) * dx *10/zoom  # -dx, 0, +dx
-        lat_end   = lat0 + bar_height
+        gaps = np.full(len(jours), np.nan)
 
-        fig.add_trace(go.Scattermapbox(
-            lon=[lon_shift, lon_shift],
-            lat=[lat0, lat_end],
+        # calcul des positions : -dx, 0, +dx, hauteur minimale pour la visibilité
+        lon_shift = lon0[visible] + (idx - 1) * dx * 10 / zoom
+        lat_start = lat0[visible]
+        lat_end = lat_start + np.maximum(jours * scale, min_height)
+
+        traces.append(go.Scattermapbox(
+            lon=np.column_stack([lon_shift, lon_shift, gaps]).ravel(),
+            lat=np.column_stack([lat_start, lat_end, gaps]).ravel(),
             mode="lines+text",
-            text=[f"{jours}"] if jours > 0 else "",
+            text=np.column_stack([jours.astype(str), np.full(len(jours), ""), np.full(len(jours), "")]).ravel(),
             textposition="top center",
             textfont=dict(size=12, color=colors[cat]),
             line=dict(width=14, color=colors[cat]),
@@ -184,12 +255,18 @@ def add_bars(   fig, stats_df, station_id,
             showlegend=False
         ))
 
-    return fig
+    return traces
+
+def create_rsqa_map(geojson, stats_df):
+    """Carte des stations et de leurs barres Bon / Acceptable / Mauvais"""
+    base_map = create_base_map(geojson, stats_df)
+    # barres de toutes les stations, construites une seule fois
+    base_map.add_traces(build_bar_traces(stats_df, scale=0.00015, min_height=0.0005))
+    return base_map
 
 def create_page5_figures(data):
-    df= data["df"]
     geojson=data["geojson_station_data"]
     stats_df=data['df_stats']
-    base_map = create_base_map(geojson, stats_df)
+    base_map = create_rsqa_map(geojson, stats_df)
     # on renvoie aussi stats_df pour la callback
     return {"map": base_map, "stats": stats_df}
@@ -0,0 +1,90 @@
+"""
+Cache persistant des couches reprojetées en EPSG:4326.
+
+Les fichiers sources sont en EPSG:2950 (MTM zone 8) ou sans CRS déclaré. Les
+reprojeter avec pyproj puis les resérialiser en GeoJSON à chaque démarrage de
+chaque worker coûte cher pour un résultat toujours identique : la couche
+reprojetée est donc écrite une fois en GeoParquet, et sa sérialisation GeoJSON à
+côté, dans data/optimized/reprojected/. Les noms de fichiers contiennent un
+condensé du contenu de la source, qui n'est reprojetée que lorsqu'elle change.
+"""
+import glob
+import hashlib
+import json
+import os
+
+import geopandas as gpd
+
+REPROJECTED_DIR = os.path.join("optimized", "reprojected")
+SOURCE_EPSG = 2950
+TARGET_EPSG = 4326
+
+
+def source_digest(path):
+    """Short SHA-256 digest of the content of a source file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def cache_path(path, suffix):
+    """Cache file of `path` for its current content, with the given suffix"""
+    directory, filename = os.path.split(path)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, REPROJECTED_DIR, f"{stem}-{source_digest(path)}{suffix}")
+
+
+def _write_atomic(path, write):
+    """Write a cache file through a temporary file so readers never see it partial"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _remove_stale(path, current):
+    """Remove the cache files of earlier versions of the source"""
+    directory = os.path.dirname(current)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    suffix = os.path.splitext(current)[1]
+    pattern = f"{glob.escape(stem)}-{'[0-9a-f]' * 16}{suffix}"
+    for stale in glob.glob(os.path.join(directory, pattern)):
+        if stale != current:
+            os.remove(stale)
+
+
+def read_reprojected(path):
+    """GeoDataFrame of `path` in EPSG:4326, from the cache when the source is unchanged"""
+    cached = cache_path(path, ".parquet")
+    if os.path.exists(cached):
+        return gpd.read_parquet(cached)
+
+    gdf = gpd.read_file(path)
+    if gdf.crs is None:
+        gdf.set_crs(epsg=SOURCE_EPSG, inplace=True)
+    gdf = gdf.to_crs(epsg=TARGET_EPSG)
+
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    _write_atomic(cached, lambda tmp_path: gdf.to_parquet(tmp_path, index=False))
+    _remove_stale(path, cached)
+    return gdf
+
+
+def read_reprojected_geojson(path):
+    """GeoJSON (dict) of `path` in EPSG:4326, serialized once per source version"""
+    cached = cache_path(path, ".geojson")
+    if os.path.exists(cached):
+        with open(cached, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    text = read_reprojected(path).to_json(default=str)
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    _write_atomic(cached, write)
+    _remove_stale(path, cached)
+    return json.loads(text)
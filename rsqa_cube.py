@@ -0,0 +1,183 @@
+"""
+Cube station x jour des indices RSQA, toutes années confondues.
+
+Pour chaque station et chaque jour, on garde l'indice maximal de la journée et le
+polluant qui l'a atteint. Deux petites tables l'accompagnent : les polluants
+mesurés par station et par année, et les coordonnées des stations. Les trois
+tables sont écrites en Parquet dans data/optimized/rsqa_cube/.
+
+Le cube est construit par optimize_data.py (au déploiement : --rsqa-cube) à
+partir de l'export complet (jeu Parquet partitionné par année s'il existe,
+sinon le CSV), puis complété par `append_export` : seuls les jours postérieurs
+au dernier jour connu de chaque station sont lus dans un nouvel export et
+ajoutés. Ces relevés ajoutés sont aussi conservés dans
+data/optimized/rsqa_appended/, que `build_cube` relit : une reconstruction ne
+perd pas les jours ajoutés. L'application ne fait que lire le cube
+(`load_cube`) et échoue s'il n'a pas été construit.
+"""
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CUBE_DIR = os.path.join("optimized", "rsqa_cube")
+APPENDED_DIR = os.path.join("optimized", "rsqa_appended")
+CUBE_TABLES = ("daily", "polluants", "stations")
+READING_COLUMNS = ["stationId", "adresse", "polluant", "date", "valeur", "latitude", "longitude"]
+READING_DTYPES = {"stationId": "int32", "adresse": "category", "polluant": "category", "valeur": "float32"}
+
+
+def cube_dir(data_dir):
+    """Directory of the cube for a data directory"""
+    return os.path.join(data_dir, CUBE_DIR)
+
+
+def appended_dir(data_dir):
+    """Directory of the readings added by append_export for a data directory"""
+    return os.path.join(data_dir, APPENDED_DIR)
+
+
+def read_readings(path):
+    """
+    Raw readings of an export (CSV file, Parquet file or year-partitioned
+    Parquet dataset), restricted to the needed columns, with compact dtypes.
+    """
+    if os.path.isdir(path) or path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        df = pq.read_table(path, columns=READING_COLUMNS, memory_map=True).to_pandas()
+        df = df.astype(READING_DTYPES)
+    else:
+        df = pd.read_csv(path, usecols=READING_COLUMNS, dtype=READING_DTYPES, parse_dates=["date"])
+    return df.dropna(subset=["valeur"])
+
+
+def summarize_readings(readings):
+    """
+    Cube tables of a block of readings:
+    - daily: stationId, date, valeur (daily maximum), polluant (first reaching it)
+    - polluants: stationId, year, polluant (pollutants measured each year)
+    - stations: stationId, adresse, latitude, longitude (first seen)
+    """
+    daily = readings.sort_values(["stationId", "date", "valeur"], ascending=[True, True, False], kind="stable")
+    daily = daily.drop_duplicates(["stationId", "date"], keep="first")
+    polluants = readings[["stationId", "polluant"]].assign(year=readings["date"].dt.year.astype("int16"))
+    return {
+        "daily": daily[["stationId", "date", "valeur", "polluant"]].reset_index(drop=True),
+        "polluants": polluants.drop_duplicates().reset_index(drop=True)[["stationId", "year", "polluant"]],
+        "stations": daily.drop_duplicates("stationId")[["stationId", "adresse", "latitude", "longitude"]]
+                         .reset_index(drop=True),
+    }
+
+
+def _write_parquet(df, path):
+    """Write a table atomically"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, index=False, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+def _write_cube(cube, directory):
+    """Write the cube tables, each one atomically"""
+    os.makedirs(directory, exist_ok=True)
+    for name in CUBE_TABLES:
+        _write_parquet(cube[name], os.path.join(directory, f"{name}.parquet"))
+
+
+def appended_files(data_dir):
+    """Readings files written by append_export, oldest first"""
+    directory = appended_dir(data_dir)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".parquet"))
+
+
+def read_cube(directory):
+    """Cube tables of `directory`, or None if the cube was not built"""
+    paths = {name: os.path.join(directory, f"{name}.parquet") for name in CUBE_TABLES}
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    return {name: pd.read_parquet(path, memory_map=True) for name, path in paths.items()}
+
+
+def build_cube(source, data_dir):
+    """
+    Build the cube of `data_dir` from a full export and the readings added
+    since by append_export, and write it
+    """
+    readings = [read_readings(path) for path in [source] + appended_files(data_dir)]
+    # Un jour présent dans l'export et dans un ajout : doublons identiques, fusionnés par summarize_readings
+    readings = readings[0] if len(readings) == 1 else _concat(readings)
+    cube = summarize_readings(readings)
+    _write_cube(cube, cube_dir(data_dir))
+    return cube
+
+
+def _concat(frames, subset=None, keep="first"):
+    """Concatenate cube tables, re-encoding the categorical columns"""
+    df = pd.concat([frame.astype({c: object for c in frame.select_dtypes("category")}) for frame in frames],
+                   ignore_index=True)
+    if subset is not None:
+        df = df.drop_duplicates(subset, keep=keep).reset_index(drop=True)
+    return df.astype({c: "category" for c in ("adresse", "polluant") if c in df})
+
+
+def append_export(export_path, data_dir):
+    """
+    Add to the cube of `data_dir` the days of a new export that are later than
+    the last day already known for each station, and keep these readings in
+    appended_dir(data_dir) for later rebuilds. Returns the number of
+    station-days added.
+    """
+    directory = cube_dir(data_dir)
+    cube = read_cube(directory)
+    if cube is None:
+        raise FileNotFoundError(f"No RSQA cube in {directory}, build it first")
+
+    readings = read_readings(export_path)
+    last_day = cube["daily"].groupby("stationId")["date"].max()
+    known_until = readings["stationId"].map(last_day).fillna(pd.Timestamp.min)
+    readings = readings[readings["date"].to_numpy() > known_until.to_numpy(dtype="datetime64[ns]")]
+    if readings.empty:
+        return 0
+
+    # Relevés conservés avant la mise à jour du cube : une reconstruction les relira
+    os.makedirs(appended_dir(data_dir), exist_ok=True)
+    stem = os.path.splitext(os.path.basename(export_path))[0]
+    _write_parquet(readings, os.path.join(appended_dir(data_dir), f"{time.strftime('%Y%m%d%H%M%S')}-{stem}.parquet"))
+
+    new = summarize_readings(readings)
+    cube = {
+        "daily": _concat([cube["daily"], new["daily"]]),
+        "polluants": _concat([cube["polluants"], new["polluants"]], subset=["stationId", "year", "polluant"]),
+        "stations": _concat([cube["stations"], new["stations"]], subset=["stationId"], keep="last"),
+    }
+    _write_cube(cube, directory)
+    return len(new["daily"])
+
+
+def load_cube(data_dir, source=None):
+    """
+    Cube of a data directory, as built by optimize_data.py. Never rebuilt
+    here: a missing cube raises FileNotFoundError, a cube older than the
+    `source` export is only reported.
+    """
+    directory = cube_dir(data_dir)
+    cube = read_cube(directory)
+    if cube is None:
+        raise FileNotFoundError(
+            f"No RSQA cube in {directory}: build it with `python optimize_data.py --rsqa-cube`"
+        )
+    daily_path = os.path.join(directory, "daily.parquet")
+    if source is not None and os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(daily_path):
+        logger.warning("RSQA cube %s is older than %s: rebuild it with `python optimize_data.py --rsqa-cube`",
+                       directory, source)
+    return cube
+
+
+def cube_years(cube):
+    """Years covered by the cube, in increasing order"""
+    return sorted(np.unique(cube["daily"]["date"].dt.year).tolist())
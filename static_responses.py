@@ -0,0 +1,120 @@
+"""
+Réponses JSON pré-sérialisées et compressées.
+
+Le layout et les figures d'hydratation des sections ne changent pas pendant la
+vie d'un processus : ils sont encodés une seule fois (encodeur JSON de Plotly,
+orjson lorsqu'il est installé), compressés en gzip et en brotli, puis servis
+tels quels avec un ETag fort. Un navigateur qui revient envoie If-None-Match et
+reçoit un 304 sans corps.
+"""
+import gzip
+import hashlib
+import threading
+
+from flask import Response, request
+from plotly.io.json import to_json_plotly
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel : gzip seulement
+    brotli = None
+
+# Les réponses sont revalidées à chaque visite (304 si l'ETag correspond)
+CACHE_CONTROL = "no-cache"
+
+
+def serialize(value):
+    """JSON bytes of a value that may hold Plotly figures and NumPy arrays"""
+    return to_json_plotly(value).encode("utf-8")
+
+
+class PreserializedResponse:
+    """Raw, gzip and brotli bodies of one JSON document, with a strong ETag"""
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.encodings = {"gzip": gzip.compress(body, compresslevel=6)}
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(body, quality=5)
+
+    def to_response(self):
+        """Response for the current request: 304, compressed or identity body"""
+        if request.if_none_match.contains(self.etag):
+            response = Response(status=304)
+        else:
+            for encoding in ("br", "gzip"):
+                if encoding in self.encodings and encoding in request.accept_encodings:
+                    response = Response(self.encodings[encoding], mimetype="application/json")
+                    response.headers["Content-Encoding"] = encoding
+                    break
+            else:
+                response = Response(self.body, mimetype="application/json")
+        response.set_etag(self.etag)
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        response.vary.add("Accept-Encoding")
+        return response
+
+
+class ResponseStore:
+    """
+    Pre-serialized responses by name, each built once by its producer
+    (a zero-argument callable returning the JSON document) on first use.
+    """
+
+    def __init__(self):
+        self._producers = {}
+        self._responses = {}
+        self._locks = {}
+
+    def register(self, name, producer):
+        self._producers[name] = producer
+        self._locks[name] = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self._producers
+
+    def get(self, name):
+        response = self._responses.get(name)
+        if response is None:
+            with self._locks[name]:
+                response = self._responses.get(name)
+                if response is None:
+                    value = self._producers[name]()
+                    body = value if isinstance(value, bytes) else serialize(value)
+                    response = PreserializedResponse(body)
+                    self._responses[name] = response
+        return response
+
+    def warm(self):
+        """Serialize every registered response now (e.g. at startup)"""
+        for name in list(self._producers):
+            self.get(name)
+
+
+def init_static_responses(app, url_prefix="static-json"):
+    """
+    Serve the `_dash-layout` of `app` from a pre-serialized response and expose
+    <routes prefix>{url_prefix}/<name>.json for the documents registered on the
+    returned store (the URL given by app.get_relative_path("/{url_prefix}/...")).
+    """
+    store = ResponseStore()
+    server = app.server
+    routes_prefix = app.config.routes_pathname_prefix
+    layout_path = routes_prefix + "_dash-layout"
+
+    # Sérialisé par Dash lui-même une seule fois : mêmes octets que serve_layout
+    store.register("_dash-layout", lambda: app.serve_layout().get_data())
+
+    @server.before_request
+    def serve_preserialized_layout():
+        if request.method == "GET" and request.path == layout_path:
+            return store.get("_dash-layout").to_response()
+
+    def json_view(name):
+        if name not in store:
+            return Response(status=404)
+        return store.get(name).to_response()
+
+    server.add_url_rule(f"{routes_prefix}{url_prefix}/<name>.json", "static_json", json_view)
+    return store
@@ -0,0 +1,199 @@
+"""
+Tuiles vectorielles (Mapbox Vector Tiles) servies par le serveur Flask.
+
+Plutôt que d'embarquer toutes les géométries d'une couche dans le JSON de la
+figure, la carte déclare une source `vector` pointant sur
+<préfixe des routes Dash>tiles/<tileset>/<version>/<z>/<x>/<y>.pbf : le
+navigateur ne télécharge que les tuiles visibles. La version (empreinte des
+fichiers sources) fait partie de l'URL : les tuiles sont mises en cache par le
+navigateur sans limite, et une mise à jour des données change les URL. Chaque tuile est produite à la demande à partir des mêmes géométries
+que les loaders (découpage, simplification au pixel du zoom, encodage MVT),
+puis écrite dans un cache sur disque partagé par les workers. Une tuile hors de
+l'emprise du tileset est refusée (404) sans être calculée ; une tuile vide
+n'est pas écrite et répond 204.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+import mapbox_vector_tile
+import numpy as np
+import shapely
+from flask import Response, abort
+
+TILE_CACHE_DIR = os.environ.get(
+    "TILE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "montreal-tiles")
+)
+TILE_EXTENT = 4096
+TILE_BUFFER = 64  # marge (unités de tuile) pour éviter les coutures aux bords
+MIN_ZOOM, MAX_ZOOM = 8, 16
+MIMETYPE = "application/vnd.mapbox-vector-tile"
+
+EARTH_RADIUS = 6378137.0
+ORIGIN_SHIFT = np.pi * EARTH_RADIUS
+
+
+def lonlat_to_mercator(coords):
+    """Project an (n, 2) array of lon/lat coordinates to Web Mercator (EPSG:3857)"""
+    lon = np.radians(coords[:, 0])
+    lat = np.radians(np.clip(coords[:, 1], -85.0511, 85.0511))
+    return np.column_stack([EARTH_RADIUS * lon, EARTH_RADIUS * np.log(np.tan(np.pi / 4 + lat / 2))])
+
+
+def tile_bounds(z, x, y):
+    """Web Mercator bounds (minx, miny, maxx, maxy) of an XYZ tile"""
+    size = 2 * ORIGIN_SHIFT / 2 ** z
+    minx = -ORIGIN_SHIFT + x * size
+    maxy = ORIGIN_SHIFT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def source_version(paths):
+    """Fingerprint of the source files of a tileset (size and mtime)"""
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+class TileLayer:
+    """One source layer of a tileset: geometries projected and indexed once"""
+
+    def __init__(self, geometries, properties):
+        geometries = np.asarray(geometries, dtype=object)
+        self.geometries = shapely.transform(geometries, lonlat_to_mercator)
+        self.properties = [
+            {key: value for key, value in props.items() if value is not None and value == value}
+            for props in properties
+        ]
+        self.tree = shapely.STRtree(self.geometries)
+        # Emprise (minx, miny, maxx, maxy) ; None pour une couche vide
+        self.bounds = shapely.total_bounds(self.geometries) if len(self.geometries) else None
+
+    def features(self, bounds, tolerance):
+        """Features clipped to `bounds` and simplified with `tolerance` (meters)"""
+        idx = self.tree.query(shapely.box(*bounds))
+        if not len(idx):
+            return []
+        clipped = shapely.clip_by_rect(self.geometries[idx], *bounds)
+        clipped = shapely.simplify(clipped, tolerance)
+        return [
+            {"geometry": geometry, "properties": self.properties[i]}
+            for i, geometry in zip(idx, clipped)
+            if not geometry.is_empty
+        ]
+
+
+class Tileset:
+    """
+    Named group of source layers rendered into tiles. `loader` returns
+    {source layer: (lon/lat geometries, properties)} and is called on the first
+    tile request only, so registering a tileset costs nothing at startup.
+    """
+
+    def __init__(self, name, loader, sources):
+        self.name = name
+        self.loader = loader
+        self.version = source_version(sources)
+        self.cache_dir = os.path.join(TILE_CACHE_DIR, f"{name}-{self.version}")
+        self._layers = None
+        self._lock = threading.Lock()
+
+    def layers(self):
+        if self._layers is None:
+            with self._lock:
+                if self._layers is None:
+                    self._layers = {
+                        layer: TileLayer(geometries, properties)
+                        for layer, (geometries, properties) in self.loader().items()
+                    }
+        return self._layers
+
+    def covers(self, z, x, y):
+        """Whether the tile z/x/y (with its buffer) intersects the extent of a layer"""
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        buffer = TILE_BUFFER * (maxx - minx) / TILE_EXTENT
+        return any(
+            minx - buffer <= bounds[2] and bounds[0] <= maxx + buffer
+            and miny - buffer <= bounds[3] and bounds[1] <= maxy + buffer
+            for bounds in (layer.bounds for layer in self.layers().values()) if bounds is not None
+        )
+
+    def render(self, z, x, y):
+        """Encode the tile z/x/y as MVT bytes"""
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        unit = (maxx - minx) / TILE_EXTENT
+        buffer = TILE_BUFFER * unit
+        clip_bounds = (minx - buffer, miny - buffer, maxx + buffer, maxy + buffer)
+        encoded_layers = [
+            {"name": layer_name, "features": features}
+            for layer_name, layer in self.layers().items()
+            if (features := layer.features(clip_bounds, unit))
+        ]
+        if not encoded_layers:
+            return b""
+        return mapbox_vector_tile.encode(encoded_layers, default_options={
+            "quantize_bounds": (minx, miny, maxx, maxy),
+            "extents": TILE_EXTENT,
+            "on_invalid_geometry": mapbox_vector_tile.encoder.on_invalid_geometry_make_valid,
+        })
+
+    def tile(self, z, x, y):
+        """
+        MVT bytes of a tile, read from the disk cache or rendered and stored
+        (empty tiles, b"", are not stored)
+        """
+        path = os.path.join(self.cache_dir, str(z), str(x), f"{y}.pbf")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read()
+        data = self.render(z, x, y)
+        if not data:
+            return data
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Écriture atomique : un autre worker ne lit jamais une tuile partielle
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return data
+
+
+def tile_url(app, tileset, url_prefix="tiles"):
+    """
+    XYZ URL template of the current version of a tileset, relative to the
+    host (mapbox-gl resolves tiles in a worker: the browser must make it
+    absolute first)
+    """
+    return app.get_relative_path(f"/{url_prefix}/{tileset.name}/{tileset.version}/{{z}}/{{x}}/{{y}}.pbf")
+
+
+def init_vector_tiles(app, tilesets, url_prefix="tiles"):
+    """
+    Serve the `tilesets` ({name: Tileset}) of `app` on
+    <routes prefix>{url_prefix}/<name>/<version>/<z>/<x>/<y>.pbf (see tile_url)
+    """
+    def tile_view(name, version, z, x, y):
+        tileset = tilesets.get(name)
+        if tileset is None or version != tileset.version:
+            abort(404)
+        if not MIN_ZOOM <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            abort(404)
+        if not tileset.covers(z, x, y):
+            abort(404)  # hors de l'emprise : rien à calculer ni à écrire
+        data = tileset.tile(z, x, y)
+        response = Response(data, mimetype=MIMETYPE) if data else Response(status=204)
+        # URL versionnée : son contenu ne change jamais
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 86400
+        response.cache_control.immutable = True
+        return response
+
+    routes_prefix = app.config.routes_pathname_prefix
+    app.server.add_url_rule(
+        f"{routes_prefix}{url_prefix}/<name>/<version>/<int:z>/<int:x>/<int:y>.pbf", "vector_tile", tile_view
+    )
+    return tilesets
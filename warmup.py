@@ -0,0 +1,99 @@
+"""
+Préchargement des données partagées entre les workers, et point de disponibilité.
+
+En production (wsgi.py, gunicorn --preload), les sections, les tuiles et les
+réponses pré-sérialisées sont construites une seule fois dans le processus
+maître, avant le fork : les workers en héritent par copie sur écriture. Pour
+que ces pages restent partagées, le ramasse-miettes est suspendu pendant le
+chargement puis les objets survivants sont gelés (`gc.freeze`) : les collectes
+des workers ne parcourent plus leurs en-têtes et ne copient donc pas les pages.
+
+Le point /ready répond 503 tant que le préchargement n'est pas terminé, 200
+ensuite. Lancée sans préchargement (python app.py, gunicorn app:server), la
+première sonde démarre le chargement dans un thread du worker.
+"""
+import gc
+import logging
+import os
+import threading
+import time
+
+from flask import jsonify
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Ordered warmup steps ((name, zero-argument callable) pairs), run once in
+    the current thread (`run`) or in a background thread (`start`).
+    """
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.timings = {}
+        self.error = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def run(self):
+        self.error = None
+        for name, step in self.steps:
+            if name in self.timings:
+                continue
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.error = f"{name}: {e}"
+                logger.exception("Warmup step %s failed", name)
+                raise
+            self.timings[name] = round(time.perf_counter() - start, 3)
+            logger.info("Warmup %s: %.2f s", name, self.timings[name])
+        self._done.set()
+
+    def start(self):
+        """Run the warmup in a background thread, unless it is done or running"""
+        with self._lock:
+            if self.ready or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run_quietly, name="warmup", daemon=True)
+            self._thread.start()
+
+    def _run_quietly(self):
+        try:
+            self.run()
+        except Exception:
+            pass  # consigné par run(), la prochaine sonde relance les étapes restantes
+
+
+def freeze_shared_objects():
+    """
+    Move every object allocated so far to the permanent generation, just
+    before forking: the collections of the workers will not touch them.
+    """
+    gc.collect()
+    gc.freeze()
+    gc.enable()
+    logger.info("Froze %d objects before forking", gc.get_freeze_count())
+
+
+def init_readiness(server, warmup, path="/ready"):
+    """Expose `path`: 200 once `warmup` is done, 503 (and start it) before"""
+    def ready_view():
+        if warmup.ready:
+            response = jsonify(status="ready", pid=os.getpid(), steps=warmup.timings)
+        else:
+            warmup.start()
+            status = "failed" if warmup.error else "warming up"
+            response = jsonify(status=status, pid=os.getpid(), steps=warmup.timings, error=warmup.error)
+            response.status_code = 503
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+    server.add_url_rule(path, "ready", ready_view)
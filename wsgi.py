@@ -0,0 +1,22 @@
+"""
+Point d'entrée de production. Avec preload_app (gunicorn.conf.py), gunicorn
+importe ce module une seule fois dans le processus maître : toutes les données
+y sont construites puis gelées avant le fork, et les workers les partagent.
+
+    gunicorn wsgi:server
+"""
+import gc
+import logging
+import os
+
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"),
+                    format="%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s")
+
+# Pas de collecte pendant le chargement : pas de trous dans les pages partagées
+gc.disable()
+
+from app import server, startup_warmup  # noqa: E402
+from warmup import freeze_shared_objects  # noqa: E402
+
+startup_warmup.run()
+freeze_shared_objects()
@@ -0,0 +1,85 @@
+"""
+Simplified, per-zoom variants of the GeoJSON layers.
+
+The maps only go from zoom ~9 to ~12, so shipping the source geometries at full
+vertex precision is wasted payload. `optimize_data.simplify_geojson_variants`
+writes one simplified copy per zoom band next to the other optimized files, and
+the loaders pick the copy that matches the zoom they display.
+"""
+import json
+import os
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping, shape
+
+# Bandes de zoom pour lesquelles une variante simplifiée est produite
+ZOOM_BANDS = (9, 10, 11, 12)
+OPTIMIZED_DIR = "optimized"
+
+
+def band_for_zoom(zoom):
+    """Return the zoom band whose variant should be used at `zoom`"""
+    eligible = [band for band in ZOOM_BANDS if band <= zoom]
+    return max(eligible) if eligible else ZOOM_BANDS[0]
+
+
+def tolerance_for_band(band):
+    """Simplification tolerance (degrees) of half a screen pixel at the band's zoom"""
+    return 360 / (256 * 2 ** band) / 2
+
+
+def variant_path(path, zoom):
+    """Path of the simplified variant of `path` for the given zoom"""
+    directory, filename = os.path.split(path)
+    stem = os.path.splitext(filename)[0]
+    if os.path.basename(directory) != OPTIMIZED_DIR:
+        directory = os.path.join(directory, OPTIMIZED_DIR)
+    return os.path.join(directory, f"{stem}_z{band_for_zoom(zoom)}.geojson")
+
+
+def find_variant(path, zoom):
+    """Return the variant of `path` for `zoom` if it was built, `path` otherwise"""
+    candidate = variant_path(path, zoom)
+    return candidate if os.path.exists(candidate) else path
+
+
+def load_variants(path, default):
+    """
+    Load every built variant of `path` as {band: geojson}. Bands without a
+    variant use `default`, the already loaded full-resolution GeoJSON.
+    """
+    variants = {}
+    for band in ZOOM_BANDS:
+        candidate = variant_path(path, band)
+        if os.path.exists(candidate):
+            with open(candidate, "r", encoding="utf-8") as f:
+                variants[band] = json.load(f)
+        else:
+            variants[band] = default
+    return variants
+
+
+def select_variant(variants, zoom):
+    """Pick the GeoJSON matching `zoom` from a {band: geojson} mapping"""
+    return variants[band_for_zoom(zoom)]
+
+
+def simplify_geojson(geojson_data, tolerance, decimals=6):
+    """
+    Return a copy of a lon/lat FeatureCollection whose geometries are simplified
+    with `tolerance` (topology of each geometry is preserved) and whose
+    coordinates are rounded to `decimals` digits.
+    """
+    geometries = np.array([shape(feature["geometry"]) for feature in geojson_data["features"]], dtype=object)
+    simplified = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    simplified = shapely.transform(simplified, lambda coords: np.round(coords, decimals))
+
+    features = []
+    for feature, geometry in zip(geojson_data["features"], simplified):
+        features.append({
+            "type": "Feature",
+            "properties": feature["properties"],
+            "geometry": mapping(geometry)
+        })
+    return {"type": "FeatureCollection", "features": features}